@@ -0,0 +1,144 @@
+import gzip
+import json
+import os
+import shutil
+import zlib
+from utils import event_key
+from durable import atomic_write, fsync_dir
+
+UNDATED = "undated"
+
+
+def partition_key(date_str):
+    """'YYYY-MM' for dated events, 'undated' otherwise."""
+    return date_str[:7] if date_str else UNDATED
+
+
+def gunzip_prefix(raw):
+    """(bytes, torn) for concatenated gzip members: everything that decompresses, and whether the rest didn't."""
+    out = []
+    while raw:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            out.append(d.decompress(raw))
+        except zlib.error:
+            return b''.join(out), True
+        if not d.eof:
+            out.append(d.flush())
+            return b''.join(out), True
+        raw = d.unused_data
+    return b''.join(out), False
+
+
+class ColdArchive:
+    """Backlog events kept out of storage.json, one JSON-lines file per user and year-month.
+
+    Layout: <root>/<user_id>/<YYYY-MM>.jsonl[.gz]. The set of partitions a
+    user has is the year/month index, so a query only opens the files for
+    the months it asks about.
+    """
+
+    def __init__(self, root, compress=True):
+        self.root = root
+        self.compress = compress
+        self.suffix = '.jsonl.gz' if compress else '.jsonl'
+        self._partitions = {}  # user_id -> set of partition keys
+        self._seen = {}  # (user_id, partition key) -> event_keys already archived there
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, user_id, key):
+        return os.path.join(self.root, user_id, key + self.suffix)
+
+    def users(self):
+        """User ids with an archive directory."""
+        return sorted(n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n)))
+
+    def partitions(self, user_id):
+        keys = self._partitions.get(user_id)
+        if keys is None:
+            try:
+                names = os.listdir(os.path.join(self.root, user_id))
+            except FileNotFoundError:
+                names = []
+            keys = self._partitions[user_id] = {n[:-len(self.suffix)] for n in names if n.endswith(self.suffix)}
+        return keys
+
+    def _read(self, user_id, key):
+        """Events in a partition. A torn tail from a crash mid-append is dropped and the file repaired."""
+        path = self._path(user_id, key)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data, torn = gunzip_prefix(raw) if self.compress else (raw, False)
+        events = []
+        lines = data.split(b'\n')
+        # a complete record always ends in a newline, so the last piece is empty or torn
+        torn = torn or lines.pop() != b''
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                torn = True
+        if torn:
+            print(f"[ERROR] {path} has a torn record; kept {len(events)} events, the original is at {path}.corrupt")
+            shutil.copy2(path, path + '.corrupt')
+            data = ''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in events).encode('utf-8')
+            atomic_write(path, gzip.compress(data) if self.compress else data)
+        return events
+
+    def append(self, user_id, events):
+        """Add events to their partitions, skipping any already archived. Returns how many were added."""
+        groups = {}
+        for e in events:
+            groups.setdefault(partition_key(e.get("date")), []).append(e)
+        added = 0
+        keys = self.partitions(user_id)
+        for key, group in groups.items():
+            seen = self._seen.get((user_id, key))
+            if seen is None:
+                events = self._read(user_id, key) if key in keys else []
+                seen = self._seen[(user_id, key)] = {event_key(e["text"], e.get("date")) for e in events}
+            lines = []
+            for e in group:
+                if event_key(e["text"], e.get("date")) not in seen:
+                    seen.add(event_key(e["text"], e.get("date")))
+                    lines.append(json.dumps(e, separators=(',', ':')) + '\n')
+            if not lines:
+                continue
+            self._append_durably(user_id, key, ''.join(lines).encode('utf-8'))
+            keys.add(key)
+            added += len(lines)
+        return added
+
+    def _append_durably(self, user_id, key, data):
+        """Append and fsync before returning, since Storage.flush drops the events from storage.json next."""
+        user_dir = os.path.join(self.root, user_id)
+        if not os.path.isdir(user_dir):
+            os.makedirs(user_dir)
+            fsync_dir(user_dir)
+        path = self._path(user_id, key)
+        created = not os.path.exists(path)
+        with open(path, 'ab') as raw:
+            if self.compress:
+                # appending to a .gz adds a gzip member; readers see one stream
+                with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                    gz.write(data)
+            else:
+                raw.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        if created:
+            fsync_dir(path)
+
+    def query(self, user_id, year=None, month=None):
+        """Archived events, optionally limited to a year and/or month (which excludes undated ones)."""
+        keys = sorted(self.partitions(user_id))
+        if year or month:
+            keys = [k for k in keys if k != UNDATED
+                    and (not year or k[:4] == str(year))
+                    and (not month or int(k[5:7]) == month)]
+        events = []
+        for key in keys:
+            events.extend(self._read(user_id, key))
+        return events
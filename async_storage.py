@@ -0,0 +1,145 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from storage import VersionConflict
+
+# compare-and-swap attempts before update() gives up
+MAX_RETRIES = 5
+
+
+class AsyncStorage:
+    """Awaitable facade over Storage or SqliteStorage.
+
+    Blocking calls run on dedicated executors instead of the event loop.
+    Mutations share a single writer thread, so writes to the backing file are
+    serialised in the order they were awaited; reads use a small pool.
+
+    Commands that read, then write based on what they read, hold
+    user_lock(user_id) and commit through update(), which retries when a
+    writer outside the lock (the reminder loop's archive pass) changed the
+    user's events in between. Different users never wait on each other's
+    locks.
+    """
+
+    def __init__(self, storage, max_readers=4):
+        self.storage = storage
+        self._readers = ThreadPoolExecutor(max_readers, thread_name_prefix="storage-read")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="storage-write")
+        self._user_locks = {}
+        self.conflicts = 0
+
+    async def _run(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+    async def _mutate(self, fn, *args):
+        """Run a mutation on the writer thread, then wait (off that thread) until it is on disk."""
+        def run():
+            return fn(*args), self.storage.pending_commit()
+        result, commit = await self._run(self._writer, run)
+        if commit is not None:
+            # the writer thread moves on meanwhile, so a burst of writes shares one fsync
+            await asyncio.wrap_future(commit)
+        return result
+
+    async def call(self, fn, *args):
+        """Run any other blocking storage work on the reader pool."""
+        return await self._run(self._readers, fn, *args)
+
+    async def write(self, fn, *args):
+        """Run any other blocking mutation on the writer thread."""
+        return await self._mutate(fn, *args)
+
+    def user_lock(self, user_id):
+        """The asyncio.Lock serialising one user's read-modify-write commands."""
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def update(self, user_id, build):
+        """Apply the StorageBatch from `await build()` only if the user's events didn't change meanwhile.
+
+        build() reads what it needs and returns a batch, or None to commit
+        nothing. On a version conflict it runs again against fresh data.
+        Returns the batch results (None if build returned None).
+        """
+        for _ in range(MAX_RETRIES):
+            version = await self.version(user_id)
+            batch = await build()
+            if batch is None:
+                return None
+            batch.expect_version(user_id, version)
+            try:
+                return await self.apply_batch(batch)
+            except VersionConflict:
+                self.conflicts += 1
+        raise VersionConflict(user_id)
+
+    async def list_users(self):
+        return await self._run(self._readers, self.storage.list_users)
+
+    async def get_user(self, user_id):
+        return await self._run(self._readers, self.storage.get_user, user_id)
+
+    async def list_tasks(self, user_id):
+        return await self._run(self._readers, self.storage.list_tasks, user_id)
+
+    async def sorted_tasks(self, user_id):
+        return await self._run(self._readers, self.storage.sorted_tasks, user_id)
+
+    async def task_at(self, user_id, position):
+        return await self._run(self._readers, self.storage.task_at, user_id, position)
+
+    async def version(self, user_id):
+        return await self._run(self._readers, self.storage.version, user_id)
+
+    async def list_backlog(self, user_id, year=None, month=None):
+        return await self._run(self._readers, self.storage.list_backlog, user_id, year, month)
+
+    async def list_birthdays(self, user_id):
+        return await self._run(self._readers, self.storage.list_birthdays, user_id)
+
+    async def birthdays_on(self, user_id, date_key):
+        return await self._run(self._readers, self.storage.birthdays_on, user_id, date_key)
+
+    async def add_task(self, user_id, text, date):
+        return await self._mutate(self.storage.add_task, user_id, text, date)
+
+    async def add_tasks(self, user_id, items):
+        return await self._mutate(self.storage.add_tasks, user_id, items)
+
+    async def remove_task(self, user_id, index):
+        return await self._mutate(self.storage.remove_task, user_id, index)
+
+    async def remove_event(self, user_id, event_id):
+        return await self._mutate(self.storage.remove_event, user_id, event_id)
+
+    async def edit_task(self, user_id, index, text, date):
+        return await self._mutate(self.storage.edit_task, user_id, index, text, date)
+
+    async def edit_event(self, user_id, event_id, text, date):
+        return await self._mutate(self.storage.edit_event, user_id, event_id, text, date)
+
+    async def archive_event(self, user_id, event):
+        return await self._mutate(self.storage.archive_event, user_id, event)
+
+    async def set_reminder_time(self, user_id, reminder_time):
+        return await self._mutate(self.storage.set_reminder_time, user_id, reminder_time)
+
+    async def set_timezone(self, user_id, offset):
+        return await self._mutate(self.storage.set_timezone, user_id, offset)
+
+    async def add_birthday(self, user_id, date_key, name):
+        return await self._mutate(self.storage.add_birthday, user_id, date_key, name)
+
+    async def remove_birthday(self, user_id, date_key, name):
+        return await self._mutate(self.storage.remove_birthday, user_id, date_key, name)
+
+    async def apply_batch(self, batch):
+        return await self._mutate(self.storage.apply_batch, batch)
+
+    async def close(self):
+        await self._run(self._writer, self.storage.close)
+        self._readers.shutdown()
+        self._writer.shutdown()
@@ -0,0 +1,307 @@
+"""Benchmarks for the storage, birthday, serialization, parsing, sorting and reminder-tick hot paths.
+
+usage: python3 bench.py [--users N] [--events M] [--output results.json]
+                        [--baseline old.json] [--threshold 0.2]
+
+Results are written as JSON ({name: {"ops", "seconds", "per_op"}}). With
+--baseline, any benchmark whose per-op time grew by more than the threshold
+is reported and the exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from columnar import EventColumns
+from dispatcher import DMDispatcher
+from resolver import UserResolver
+from scheduler import ReminderScheduler
+from serializer import SERIALIZERS, get_serializer, load_document, read_user
+from storage import Storage
+from utils import event_record, extract_time, get_date, parse_event_text, parse_many, sort_key, strip_year
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+WORDS = ['dentist', 'meeting', 'groceries', 'call mom', 'deadline', 'gym', 'rent', 'exam', 'party', 'flight']
+
+# the busy minute the tick benchmark runs at: 03:30 UTC, the default reminder time
+TICK_AT = datetime(2026, 3, 1, 3, 30)
+
+
+def event_text(rng, year):
+    month = rng.randrange(12)
+    day = rng.randint(1, 28)
+    parts = [MONTHS[month], str(day)]
+    if rng.random() < 0.3:
+        parts.append(str(year))
+    if rng.random() < 0.6:
+        parts.append(f"{rng.randint(0, 23)}:{rng.choice(['00', '15', '30', '45'])}")
+    parts.append(rng.choice(WORDS))
+    parts.append(str(rng.randint(1, 999)))
+    return ' '.join(parts)
+
+
+def make_dataset(users, events, backlog, birthdays, seed=0):
+    """Return (storage data, birthdays data) with users x events active events each."""
+    rng = random.Random(seed)
+    data = {}
+    for u in range(users):
+        user_events = []
+        for i in range(events):
+            text = strip_year(event_text(rng, 2026))
+            user_events.append(dict(event_record(text, f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"), id=i + 1))
+        user_backlog = [event_record(event_text(rng, 2025), f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+                        for _ in range(backlog)]
+        data[str(100000 + u)] = {
+            "events": user_events,
+            "backlog": user_backlog,
+            "timezone": rng.choice([-8, -5, 0, 1, 5.5, 9]),
+            "reminder_time": "03:30",
+            "next_id": events + 1,
+        }
+    bdays = {}
+    for i in range(birthdays):
+        key = f"{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        bdays[key] = f"{bdays[key]}/person{i}" if key in bdays else f"person{i}"
+    return data, bdays
+
+
+def timed(fn, ops, repeat):
+    """Best-of-repeat wall time for fn(), which performs `ops` operations."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"ops": ops, "seconds": best, "per_op": best / ops if ops else 0}
+
+
+class FakeChannel:
+    async def send(self, msg):
+        await asyncio.sleep(0)
+
+
+class FakeUser:
+    def __init__(self):
+        self.dm_channel = FakeChannel()
+
+
+class FakeClient:
+    """Stands in for the discord client: every user is already in its cache."""
+
+    def get_user(self, user_id):
+        return FakeUser()
+
+    async def fetch_user(self, user_id):
+        return FakeUser()
+
+
+def bench_storage(workdir, data, repeat):
+    path = os.path.join(workdir, 'storage.json')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    results = {}
+    results["storage_load"] = timed(lambda: Storage(path), 1, repeat)
+
+    storage = Storage(path, flush_interval=3600)
+    user_ids = list(data)
+    results["storage_list_tasks"] = timed(lambda: [storage.list_tasks(u) for u in user_ids], len(user_ids), repeat)
+    results["storage_sorted_tasks"] = timed(lambda: [storage.sorted_tasks(u) for u in user_ids], len(user_ids), repeat)
+
+    counter = iter(range(10 ** 9))
+    results["storage_add_task"] = timed(
+        lambda: [storage.add_task(u, f"bench event {next(counter)}", datetime.max) for u in user_ids],
+        len(user_ids), repeat)
+    results["storage_remove_task"] = timed(
+        lambda: [storage.remove_task(u, 0) for u in user_ids], len(user_ids), repeat)
+    results["storage_flush"] = timed(lambda: (storage._dirty.add(user_ids[0]), storage.flush()), 1, repeat)
+    storage._dirty.clear()
+    return results
+
+
+def bench_birthdays(workdir, data, bdays, repeat):
+    """Loading the birthday file, then the per-user lookup each daily summary makes."""
+    path = os.path.join(workdir, 'birthdays.json')
+    with open(path, 'w') as f:
+        json.dump(bdays, f)
+    storage_path = os.path.join(workdir, 'birthdays-storage.json')
+    results = {}
+    results["birthdays_load"] = timed(
+        lambda: Storage(storage_path, birthdays_filename=path).list_birthdays(None), 1, repeat)
+
+    storage = Storage(storage_path, birthdays_filename=path)
+    user_ids = list(data)
+    date_keys = [f"{m:02d}-{d:02d}" for m in range(1, 13) for d in range(1, 29)]
+    results["birthdays_on"] = timed(
+        lambda: [storage.birthdays_on(u, date_keys[i % len(date_keys)]) for i, u in enumerate(user_ids)],
+        len(user_ids), repeat)
+    return results
+
+
+def bench_serializers(workdir, data, repeat):
+    """Encode/decode time and file size for each storage format; "bytes" is the encoded size."""
+    results = {}
+    user_id = next(iter(data))
+    for name in SERIALIZERS:
+        serializer = get_serializer(name)
+        raw = serializer.dump(data)
+        results[f"encode_{name}"] = dict(timed(lambda: serializer.dump(data), 1, repeat), bytes=len(raw))
+        # dict() forces every user of a snapshot to be decoded, as a full load would
+        results[f"decode_{name}"] = timed(lambda: dict(load_document(raw)), 1, repeat)
+        if name == 'snapshot':
+            path = os.path.join(workdir, 'snapshot.bin')
+            with open(path, 'wb') as f:
+                f.write(raw)
+            results["snapshot_read_user"] = timed(lambda: read_user(path, user_id), 1, repeat)
+    return results
+
+
+def bench_sweeps(data, repeat):
+    """The summary tick's "dated tomorrow" scan, per-dict walk against EventColumns (vectorised with NumPy)."""
+    users = {user_id: dict(user_data) for user_id, user_data in data.items()}
+    rows = sum(len(user_data["events"]) for user_data in users.values())
+    now = TICK_AT
+
+    def walk_tomorrow():
+        out = []
+        for u, d in users.items():
+            tomorrow = ((now + timedelta(hours=d.get("timezone", 0))).date() + timedelta(days=1)).isoformat()
+            out.extend(e for e in d["events"] if e.get("date") == tomorrow and not e["has_time"])
+        return out
+
+    columns = EventColumns(users)
+    return {
+        "sweep_build_columns": timed(lambda: EventColumns(users), rows, repeat),
+        "sweep_tomorrow_walk": timed(walk_tomorrow, rows, repeat),
+        "sweep_tomorrow_columns": timed(lambda: columns.dated_tomorrow(now), rows, repeat),
+    }
+
+
+def legacy_parse(text):
+    """The three separate regex passes utils used before parse_event_text, for comparison."""
+    re.sub(r'(\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+[0-3]?\d)\s+\d{4}', r'\1', text, flags=re.I)
+    date_re = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+[0-3]?\d(?:\s+\d{4})?\b', re.I)
+    m = date_re.search(text)
+    if m:
+        try:
+            datetime.strptime(m.group(0), "%b %d %Y")
+        except ValueError:
+            datetime.strptime(m.group(0), "%b %d").replace(year=datetime.now().year)
+    re.compile(r'\b(\d{1,2}):(\d{2})\s*(am|pm)?\b', re.I).search(text)
+
+
+def parse_cold(texts):
+    parse_event_text.cache_clear()
+    return [parse_event_text(t) for t in texts]
+
+
+def bench_parsing(data, repeat):
+    texts = [e["text"] for user_data in data.values() for e in user_data["events"]]
+    events = [{"text": e["text"], "date": e["date"]} for user_data in data.values() for e in user_data["events"]]
+    return {
+        "parse_legacy": timed(lambda: [legacy_parse(t) for t in texts], len(texts), repeat),
+        # cold clears the memo first, so it measures the parse itself
+        "parse_cold": timed(lambda: parse_cold(texts), len(texts), repeat),
+        "parse_many_warm": timed(lambda: parse_many(texts), len(texts), repeat),
+        "get_date": timed(lambda: [get_date(t) for t in texts], len(texts), repeat),
+        "extract_time": timed(lambda: [extract_time(t) for t in texts], len(texts), repeat),
+        "strip_year": timed(lambda: [strip_year(t) for t in texts], len(texts), repeat),
+        # fresh copies so derived fields are recomputed, as for legacy records
+        "sort_key_cold": timed(lambda: [sort_key(dict(e)) for e in events], len(events), repeat),
+        "sort_events": timed(lambda: sorted(events, key=sort_key), len(events), repeat),
+    }
+
+
+def bench_tick(workdir, data, repeat):
+    """One reminder tick: build the schedule, pop the busy minute, deliver every DM."""
+    path = os.path.join(workdir, 'tick.json')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    storage = Storage(path)
+    results = {}
+
+    scheduler = ReminderScheduler(storage)
+    results["scheduler_build"] = timed(lambda: scheduler.build(TICK_AT - timedelta(minutes=1)), 1, repeat)
+
+    def tick():
+        scheduler.build(TICK_AT - timedelta(minutes=1))
+        due = scheduler.pop_due(TICK_AT)
+
+        async def deliver():
+            dispatcher = DMDispatcher(UserResolver(FakeClient()), workers=8)
+            dispatcher.start()
+            for reminder in due:
+                dispatcher.enqueue(reminder.user_id, reminder.kind)
+            await dispatcher.stop()
+
+        asyncio.run(deliver())
+        return len(due)
+
+    results["reminder_tick"] = timed(tick, len(data), repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks whose per-op time regressed by more than threshold (0.2 = 20%)."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old and old["per_op"] > 0 and result["per_op"] > old["per_op"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def run(users, events, backlog, birthdays, repeat):
+    data, bdays = make_dataset(users, events, backlog, birthdays)
+    workdir = tempfile.mkdtemp(prefix='type-bot-bench-')
+    try:
+        results = {}
+        results.update(bench_storage(workdir, data, repeat))
+        results.update(bench_birthdays(workdir, data, bdays, repeat))
+        results.update(bench_serializers(workdir, data, repeat))
+        results.update(bench_parsing(data, repeat))
+        results.update(bench_sweeps(data, repeat))
+        results.update(bench_tick(workdir, data, repeat))
+        return results
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--backlog', type=int, default=100)
+    parser.add_argument('--birthdays', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='-')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run(args.users, args.events, args.backlog, args.birthdays, args.repeat)
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output == '-':
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name in regressions:
+            print(f"[REGRESSION] {name}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,27 @@
 import os
+import io
+import asyncio
+import atexit
+import signal
+from collections import OrderedDict
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from dotenv import load_dotenv
-from storage import Storage
+from storage import Storage, StorageBatch
+from archive import ColdArchive
+from serializer import get_serializer
+from sqlite_storage import SqliteStorage
+from async_storage import AsyncStorage
+from resolver import UserResolver
+from dispatcher import DMDispatcher, SENT, GAVE_UP
+from metrics import TickStats, write_metrics
+from scheduler import ReminderScheduler, reminder_key, SUMMARY, HOUR_BEFORE, ARCHIVE
+from ledger import SentLedger
+from scheduler_pool import SchedulerPool
+from engine import CommandEngine, PREFIXES, parse_command
+from columnar import EventColumns
+from render import RenderCache
 from datetime import datetime, timedelta
-from utils import sort_key, get_date, strip_year, format_tz, get_reminder_time_utc, get_event_utc_datetime, parse_backlog_filter, matches_date_filter
 
 os.makedirs("self", exist_ok=True)
 with open("self/bot.pid", "a") as f:
@@ -15,343 +32,305 @@ TOKEN = os.getenv('DISCORD_TOKEN')
 
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix=['type ', 'Type ', 'TYPE '], intents=intents, help_command=None)
+# how long shutdown waits for queued DMs before giving up on them
+DRAIN_TIMEOUT = 20
 
-@bot.event
-async def on_command_error(ctx, error):
-    if isinstance(error, commands.CommandNotFound):
-        await ctx.send('```Unknown command. Type `type help` for a list of commands.```')
-    else:
-        raise error
-storage = Storage('storage.json')
+class TypeBot(commands.Bot):
+    async def setup_hook(self):
+        # once the loop runs, SIGTERM closes the bot normally instead of raising
+        # KeyboardInterrupt, which would cancel the dispatcher's workers before they drain
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+
+    async def close(self):
+        # SIGTERM (the cron pkill) ends up here: send what's queued while the connection is still open
+        try:
+            await asyncio.wait_for(dispatcher.stop(), timeout=DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"[ERROR] shutting down with {dispatcher.pending} DMs unsent")
+        await super().close()
+
+bot = TypeBot(command_prefix=PREFIXES, intents=intents, help_command=None)
+
+if os.getenv('STORAGE_BACKEND') == 'sqlite':
+    # migrate once with: python3 sqlite_storage.py
+    backend = SqliteStorage('storage.db')
+else:
+    # removed events live in archive/<user>/<YYYY-MM>.jsonl.gz, keeping storage.json to active events
+    archive = ColdArchive(os.getenv('ARCHIVE_DIR', 'archive'), compress=os.getenv('ARCHIVE_COMPRESS', '1') != '0')
+    # STORAGE_FORMAT: json-pretty (default), json (compact, orjson if installed) or snapshot (per-user offsets)
+    # writes within STORAGE_COMMIT_MS of each other share one fsync; commands reply once theirs is on disk
+    backend = Storage('storage.json', archive=archive,
+                      serializer=get_serializer(os.getenv('STORAGE_FORMAT', 'json-pretty')),
+                      commit_window=float(os.getenv('STORAGE_COMMIT_MS', '5')) / 1000,
+                      backups=int(os.getenv('STORAGE_BACKUPS', '3')))
+atexit.register(backend.close)
+# commands and the reminder loop only touch storage through this, off the event loop
+storage = AsyncStorage(backend)
+# let `pkill -f bot.py` shut down cleanly so pending writes are flushed
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+ledger = SentLedger('self/sent.log')
+atexit.register(ledger.close)
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '0'))
+if SCHEDULER_WORKERS > 0:
+    # evaluate reminders in worker processes; forked here, before any threads exist
+    scheduler = SchedulerPool(SCHEDULER_WORKERS, ledger=ledger)
+    scheduler.start()
+    atexit.register(scheduler.close)
+else:
+    scheduler = ReminderScheduler(backend, ledger=ledger)
+tick_stats = TickStats()
+resolver = UserResolver(bot, stats=tick_stats)
+dispatcher = DMDispatcher(resolver, stats=tick_stats)
+METRICS_FILE = 'self/metrics.json'
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '60'))
+schedule_changed = asyncio.Event()
+reminder_task = None
+metrics_task = None
+
+async def reschedule(user_id):
+    """Refresh a user's pending reminders after their data changed."""
+    user_data = await storage.get_user(user_id)
+    scheduler.reschedule_user(user_id, datetime.utcnow(), user_data)
+    schedule_changed.set()
 
 @bot.event
 async def on_ready():
-    reminder_loop.start()
-
-@bot.command()
-async def help(ctx):
-    msg = '''```
-🐱🌹 Type Bot Help 🌹🐱
-> type add jan 15 10:30 example event
-> type list
-> type remove 1
-> type edit 1 "updated event"
-> type append 1 "extra text"
-> type backlog feb 2026
-> type birthday add feb 4 jason
-> type birthday list feb
-> type birthday remove feb 4 jason
-> type time HH:MM
-> type timezone -5
-> type shit
-```'''
-    await ctx.send(msg)
-
-@bot.command()
-async def add(ctx, *, text: str):
-    user_id = str(ctx.author.id)
-    first_time = False
-    events = storage.list_tasks(user_id)
-    if not events:
-        first_time = True
-
-    date = get_date(text)
-    stripped = strip_year(text)
-
-    if not storage.add_task(user_id, stripped, date):
-        await ctx.send(f'```Event already exists: {stripped}```')
-        return
+    global reminder_task, metrics_task
+    dispatcher.start()
+    # on_ready fires again after reconnects
+    if reminder_task is None or reminder_task.done():
+        reminder_task = asyncio.create_task(reminder_loop())
+    if metrics_task is None or metrics_task.done():
+        metrics_task = asyncio.create_task(metrics_loop())
+
+def stats_text():
+    msg = tick_stats.format()
+    msg += '\n' + ' '.join(f'{k}={v}' for k, v in resolver.stats().items())
+    msg += '\n' + ' '.join(f'{k}={v}' for k, v in dispatcher.stats().items() if not k.startswith('latency'))
+    msg += '\n' + ' '.join(f'render_{k}={v}' for k, v in renders.stats().items())
+    msg += f' storage_conflicts={storage.conflicts}'
+    return msg
+
+# `type list` and the daily summary share pre-rendered message chunks
+renders = RenderCache(backend)
+engine = CommandEngine(storage, stats_text=stats_text, renders=renders)
 
-    # find index of newly added event in sorted list
-    events = storage.list_tasks(user_id)
-    sorted_events = sorted(events, key=sort_key)
-    index = next(i for i, e in enumerate(sorted_events) if e["text"] == stripped) + 1
-
-    await ctx.send(f'```Event added ({index}): {stripped}```')
-    if first_time:
-        await ctx.send('''```
-🐱🌹 Welcome! Set your timezone first: type timezone -5 (for EST) 🌹🐱
-> type add jan 15 10:30 example event
-> type list
-> type remove 1
-> type edit 1 "updated event"
-> type append 1 "extra text"
-> type time HH:MM
-> type help
-```''')
-
-@bot.command()
-async def list(ctx):
-    user_id = str(ctx.author.id)
-    events = storage.list_tasks(user_id)
-    if not events:
-        await ctx.send('```No events found.```')
-        return
-    sorted_events = sorted(events, key=sort_key)
-    msg = '\n'.join([f'{i+1}. {e["text"]}' for i, e in enumerate(sorted_events)])
-    await ctx.send(f'```{msg}```')
-
-@bot.command()
-async def backlog(ctx, *, filter: str = ""):
-    if not filter.strip():
-        await ctx.send('```Usage: type backlog 2026 or type backlog feb 2026```')
+@bot.event
+async def on_message(message):
+    # all command logic lives in engine.py; this only translates to and from Discord
+    if message.author.bot or parse_command(message.content) is None:
         return
+    is_owner = await bot.is_owner(message.author)
+    result = await engine.handle(str(message.author.id), message.content, message.attachments, is_owner=is_owner)
+    for user_id in result.reschedule:
+        await reschedule(user_id)
+    for reply in result.replies:
+        if reply.file:
+            filename, content = reply.file
+            await message.channel.send(reply.text, file=discord.File(io.BytesIO(content), filename=filename))
+        else:
+            sent = await message.channel.send(reply.text)
+            if reply.pager:
+                await track_pager(sent, message.author.id, reply.pager)
+
+# paged list/backlog messages: message id -> (user id, (prev cursor, next cursor))
+PAGE_PREV = '◀️'
+PAGE_NEXT = '▶️'
+MAX_PAGERS = 1000
+pagers = OrderedDict()
+
+async def track_pager(sent, user_id, pager):
+    pagers[sent.id] = (user_id, pager)
+    while len(pagers) > MAX_PAGERS:
+        pagers.popitem(last=False)
+    for emoji in (PAGE_PREV, PAGE_NEXT):
+        await sent.add_reaction(emoji)
+
+async def flip_page(reaction, user):
+    entry = pagers.get(reaction.message.id)
+    if entry is None or user.id != entry[0]:
+        return False
+    owner_id, (prev_cursor, next_cursor) = entry
+    emoji = str(reaction.emoji)
+    cursor = prev_cursor if emoji == PAGE_PREV else next_cursor if emoji == PAGE_NEXT else None
+    if cursor is None:
+        return False
+    reply = await engine.page(owner_id, cursor)
+    if reply is None:
+        return False
+    await reaction.message.edit(content=reply.text)
+    pagers[reaction.message.id] = (owner_id, reply.pager or (None, None))
+    return True
 
-    user_id = str(ctx.author.id)
-    events = storage.list_backlog(user_id)
-    if not events:
-        await ctx.send('```No backlog found.```')
+@bot.event
+async def on_reaction_add(reaction, user):
+    if not await flip_page(reaction, user) or isinstance(reaction.message.channel, discord.DMChannel):
         return
+    try:
+        # lets the same arrow be pressed again
+        await reaction.remove(user)
+    except discord.HTTPException:
+        pass
 
-    # Parse filter: "2026" or "feb 2026"
-    year, month = parse_backlog_filter(filter)
-    events = [e for e in events if matches_date_filter(e.get("date"), year, month)]
-
-    sorted_events = sorted(events, key=sort_key)
-    if not sorted_events:
-        await ctx.send('```No matching backlog events.```')
-        return
-    msg = '\n'.join([f'{i+1}. {e["text"]}' for i, e in enumerate(sorted_events)])
-    await ctx.send(f'```{msg}```')
-
-@bot.command()
-async def remove(ctx, *indices: int):
-    user_id = str(ctx.author.id)
-    events = storage.list_tasks(user_id)
-    if not events:
-        await ctx.send('```No events found.```')
-        return
-    sorted_events = sorted(events, key=sort_key)
-    removed = []
-    # remove from highest index to lowest to avoid shifting issues
-    for index in sorted(set(indices), reverse=True):
-        if 0 <= index - 1 < len(sorted_events):
-            storage_index = events.index(sorted_events[index - 1])
-            event = events[storage_index]
-            storage.remove_task(user_id, storage_index)
-            removed.append(f"{index}. {event['text']}")
-            events.pop(storage_index)
-    if removed:
-        removed.reverse()
-        await ctx.send(f"```Removed events:\n" + "\n".join(removed) + "```")
-    else:
-        await ctx.send("```Invalid indices.```")
-
-@bot.command()
-async def edit(ctx, index: int, *, text: str):
-    user_id = str(ctx.author.id)
-    events = storage.list_tasks(user_id)
-    sorted_events = sorted(events, key=sort_key)
-    if 0 <= index - 1 < len(sorted_events):
-        event_to_edit = sorted_events[index - 1]
-        old_text = event_to_edit["text"]
-        storage_index = events.index(event_to_edit)
-        date = get_date(text)
-        new_text = strip_year(text)
-        success = storage.edit_task(user_id, storage_index, new_text, date)
-        if success:
-            await ctx.send(f'```Event {index} updated:\n{old_text}\n→ {new_text}```')
-        else:
-            await ctx.send('```Invalid index.```')
-    else:
-        await ctx.send('```Invalid index.```')
-
-@bot.command()
-async def append(ctx, index: int, *, text: str):
-    user_id = str(ctx.author.id)
-    events = storage.list_tasks(user_id)
-    sorted_events = sorted(events, key=sort_key)
-    if 0 <= index - 1 < len(sorted_events):
-        event = sorted_events[index - 1]
-        combined_text = event["text"] + " " + text
-        await edit(ctx, index, text=combined_text)
+@bot.event
+async def on_reaction_remove(reaction, user):
+    # the bot can't remove reactions in DMs, so there un-pressing an arrow flips the page too;
+    # in servers the bot removes them itself and this event is its own doing
+    if isinstance(reaction.message.channel, discord.DMChannel):
+        await flip_page(reaction, user)
+
+def summary_inputs(user_ids, now_utc):
+    """{user_id: (timezone, [untimed events dated tomorrow])} for the summaries due at now_utc, in one columnar sweep."""
+    users = {user_id: backend.get_user(user_id) for user_id in user_ids}
+    columns = EventColumns(users)
+    tomorrow = {user_id: [] for user_id in user_ids}
+    for i in columns.dated_tomorrow(now_utc):
+        user_id, event = columns.row(i)
+        tomorrow[user_id].append(event["text"])
+    return {user_id: (users[user_id].get("timezone", 0), tomorrow[user_id]) for user_id in user_ids}
+
+async def tick_summary_inputs(due):
+    """summary_inputs for every summary in one tick, keyed by (due, user_id)."""
+    by_due = {}
+    for reminder in due:
+        if reminder.kind == SUMMARY:
+            by_due.setdefault(reminder.due, []).append(reminder.user_id)
+    inputs = {}
+    with tick_stats.timer("storage"):
+        for due_at, user_ids in by_due.items():
+            for user_id, value in (await storage.call(summary_inputs, user_ids, due_at)).items():
+                inputs[(due_at, user_id)] = value
+    return inputs
+
+async def daily_summary_messages(user_id, now_utc, tz_offset, tomorrow_events):
+    with tick_stats.timer("storage"):
+        chunks = await storage.call(renders.chunks, user_id, "summary")
+        tomorrow_local = (now_utc + timedelta(hours=tz_offset)).date() + timedelta(days=1)
+        birthdays = await storage.birthdays_on(user_id, tomorrow_local.strftime("%m-%d"))
+
+    messages = list(chunks)
+
+    # Birthday reminders at daily summary time
+    if birthdays:
+        names = ', '.join(birthdays)
+        messages.append(f'```🎂 birthday tomorrow: {names} 🐱🌹```')
+
+    # Events without a time: remind 1 day before at user's reminder_time
+    for text in tomorrow_events:
+        messages.append(f'```⏰ Tomorrow: {text} 🐱🌹```')
+    return messages
+
+# reminder key -> due, for reminders whose DMs haven't all been sent; a failed one stays
+# here so the ledger never completes a tick past it and a restart catches it up
+undelivered = {}
+
+def deliver_done(reminder, key):
+    def done(outcome):
+        if outcome == GAVE_UP:
+            tick_stats.incr("failures")
+            return
+        undelivered.pop(key, None)
+        if outcome == SENT:
+            ledger.mark_sent(key, reminder.due)
+    return done
+
+async def deliver(reminder, summaries):
+    if reminder.kind == SUMMARY:
+        # use the scheduled instant so a late wakeup still sees the right "tomorrow"
+        messages = await daily_summary_messages(reminder.user_id, reminder.due,
+                                                *summaries[(reminder.due, reminder.user_id)])
+    elif reminder.kind == HOUR_BEFORE:
+        messages = [f'```⏰ In 1 hour: {reminder.event["text"]} 🐱🌹```']
     else:
-        await ctx.send('```Invalid index.```')
-
-@bot.command()
-async def time(ctx, time: str = ""):
-    user_id = str(ctx.author.id)
-    data = storage._read()
-    tz = data.get(user_id, {}).get("timezone", 0)
-    if not time or time.strip() == "":
-        reminder_time = data.get(user_id, {}).get("reminder_time", "03:30")
-        await ctx.send(f'```Your reminder time is {reminder_time} ({format_tz(tz)}).```')
         return
+    key = reminder_key(reminder)
+    undelivered[key] = reminder.due
+    # the dispatcher's workers do the actual send, so a reminder tick never waits on Discord;
+    # the ledger entry is written once every message has actually gone out
+    dispatcher.enqueue_all(reminder.user_id, messages, deliver_done(reminder, key))
+
+def completed_through(now_utc):
+    """Latest instant the ledger may record as a completed tick: just before anything undelivered."""
+    if not undelivered:
+        return now_utc
+    return min(now_utc, min(undelivered.values()) - timedelta(minutes=1))
+
+async def archive_expired(reminders):
+    """Archive every expired event from one tick in a single batch."""
+    batch = StorageBatch()
+    for reminder in reminders:
+        batch.archive_event(reminder.user_id, reminder.event)
+    with tick_stats.timer("archive"):
+        await storage.apply_batch(batch)
+    tick_stats.incr(ARCHIVE, len(reminders))
+
+async def handle_due(now_utc, due):
+    """Deliver one tick's reminders and archive its expired events."""
+    to_archive = [r for r in due if r.kind == ARCHIVE]
     try:
-        hour, minute = map(int, time.split(':'))
-        if 0 <= hour < 24 and 0 <= minute < 60:
-            storage.set_reminder_time(user_id, f"{hour:02d}:{minute:02d}")
-            await ctx.send(f'```Reminder time set to {hour:02d}:{minute:02d} ({format_tz(tz)}).```')
-        else:
-            await ctx.send('```Invalid time format. Use HH:MM (e.g., 18:02).```')
-    except ValueError as ve:
-        await ctx.send('```Invalid time format. Use HH:MM (e.g., 18:02).```')
+        summaries = await tick_summary_inputs(due)
     except Exception as e:
-        await ctx.send(f'```Unknown error: {str(e)}```')
-
-@bot.command()
-async def timezone(ctx, offset: str = ""):
-    user_id = str(ctx.author.id)
-    if not offset or offset.strip() == "":
-        data = storage._read()
-        tz = data.get(user_id, {}).get("timezone", 0)
-        await ctx.send(f'```Your timezone is {format_tz(tz)}.```')
-        return
-    try:
-        tz = float(offset)
-        if -12 <= tz <= 14:
-            storage.set_timezone(user_id, tz)
-            await ctx.send(f'```Timezone set to {format_tz(tz)}.```')
-        else:
-            await ctx.send('```Invalid timezone. Use an offset like -5 (EST), 5.5 (IST), or -3.5 (NST).```')
-    except ValueError:
-        await ctx.send('```Invalid timezone. Use an offset like -5 (EST), 5.5 (IST), or -3.5 (NST).```')
-
-MONTHS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-           'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
-MONTH_NAMES = {v: k for k, v in MONTHS.items()}
-
-@bot.command()
-async def birthday(ctx, *, text: str = ""):
-    user_id = str(ctx.author.id)
-    parts = text.strip().split()
-
-    if not parts or parts[0] == "list":
-        birthdays = storage.list_birthdays(user_id)
-        if not birthdays:
-            await ctx.send('```no birthdays saved.```')
-            return
-        # optional month filter: type birthday list feb
-        month_filter = None
-        if len(parts) >= 2 and parts[1].lower() in MONTHS:
-            month_filter = f"{MONTHS[parts[1].lower()]:02d}"
-        # sort by month/day (MM-DD sorts lexicographically)
-        sorted_dates = sorted(birthdays.keys())
-        lines = []
-        for d in sorted_dates:
-            month_num, day = int(d.split('-')[0]), int(d.split('-')[1])
-            if month_filter and d.split('-')[0] != month_filter:
-                continue
-            names = ', '.join(birthdays[d])
-            lines.append(f"{MONTH_NAMES[month_num]} {day} - {names}")
-        if not lines:
-            await ctx.send('```no birthdays found for that month.```')
-            return
-        await ctx.send(f'```{chr(10).join(lines)}```')
-        return
-
-    if parts[0] == "add":
-        if len(parts) < 4:
-            await ctx.send('```usage: type birthday add feb 4 jason```')
-            return
-        month_str = parts[1].lower()
-        if month_str not in MONTHS:
-            await ctx.send('```invalid month. use jan, feb, mar, etc.```')
-            return
+        # each summary then fails in deliver below, like any other delivery error
+        summaries = {}
+        print(f"[ERROR] could not read summary data: {e}")
+    for reminder in due:
+        if reminder.kind == ARCHIVE:
+            continue
+        # anything handled more than a minute late would have been missed by the old 1-minute loop
+        if (datetime.utcnow() - reminder.due).total_seconds() > 60:
+            tick_stats.incr("overruns")
         try:
-            day = int(parts[2])
-        except ValueError:
-            await ctx.send('```invalid day. use a number like 4, 15, etc.```')
-            return
-        name = ' '.join(parts[3:])
-        date_key = f"{MONTHS[month_str]:02d}-{day:02d}"
-        if storage.add_birthday(user_id, date_key, name):
-            birthdays = storage.list_birthdays(user_id)
-            names = ', '.join(birthdays[date_key])
-            await ctx.send(f'```birthday added: {MONTH_NAMES[MONTHS[month_str]]} {day} - {names}```')
-        else:
-            await ctx.send(f'```{name} is already on {MONTH_NAMES[MONTHS[month_str]]} {day}.```')
-        return
-
-    if parts[0] == "remove":
-        if len(parts) < 4:
-            await ctx.send('```usage: type birthday remove feb 4 jason```')
-            return
-        month_str = parts[1].lower()
-        if month_str not in MONTHS:
-            await ctx.send('```invalid month.```')
-            return
+            await deliver(reminder, summaries)
+            tick_stats.incr(reminder.kind)
+        except Exception as e:
+            tick_stats.incr("failures")
+            print(f"[ERROR] reminder failed for {reminder.user_id} ({reminder.kind}): {e}")
+    if to_archive:
         try:
-            day = int(parts[2])
-        except ValueError:
-            await ctx.send('```invalid day.```')
-            return
-        name = ' '.join(parts[3:])
-        date_key = f"{MONTHS[month_str]:02d}-{day:02d}"
-        if storage.remove_birthday(user_id, date_key, name):
-            await ctx.send(f'```birthday removed: {name} from {MONTH_NAMES[MONTHS[month_str]]} {day}.```')
-        else:
-            await ctx.send(f'```birthday not found: {name} on {MONTH_NAMES[MONTHS[month_str]]} {day}.```')
-        return
-
-    await ctx.send('```usage: type birthday add/remove/list```')
-
-@bot.command()
-async def shit(ctx):
-    await ctx.send('```type shit 🐱🌹```')
+            await archive_expired(to_archive)
+        except Exception as e:
+            tick_stats.incr("failures")
+            print(f"[ERROR] archive sweep failed for {len(to_archive)} events: {e}")
+    if due and now_utc:
+        ledger.complete_tick(completed_through(now_utc))
 
-@tasks.loop(minutes=1)
 async def reminder_loop():
-    now_utc = datetime.utcnow()
-    data = storage._read()
-    for user_id, user_data in data.items():
-        tz_offset = user_data.get("timezone", 0)
-        reminder_time = user_data.get("reminder_time", "03:30")
-        reminder_time_utc = get_reminder_time_utc(reminder_time, tz_offset, now_utc.date())
-
-        # Daily summary at configured time
-        if now_utc.strftime("%H:%M") == reminder_time_utc.strftime("%H:%M"):
-            events = user_data.get("events", [])
-            if events:
-                user = await bot.fetch_user(int(user_id))
-                sorted_events = sorted(events, key=sort_key)
-                msg = '\n'.join([f'{i+1}. {e["text"]} 🐱🌹' for i, e in enumerate(sorted_events)])
-                await user.send(f'```Your upcoming events:\n{msg}```')
-
-            # Birthday reminders at daily summary time
-            birthdays = storage.list_birthdays(user_id)
-            if birthdays:
-                now_local = now_utc + timedelta(hours=tz_offset)
-                tomorrow_local = now_local.date() + timedelta(days=1)
-                tomorrow_key = f"{tomorrow_local.month:02d}-{tomorrow_local.day:02d}"
-                if tomorrow_key in birthdays:
-                    names = ', '.join(birthdays[tomorrow_key])
-                    user = await bot.fetch_user(int(user_id))
-                    await user.send(f'```🎂 birthday tomorrow: {names} 🐱🌹```')
-
-        # Per-event reminders and auto-archive
-        events = user_data.get("events", [])
-        to_archive = []
-        for event in events:
-            try:
-                event_utc = get_event_utc_datetime(event, tz_offset)
-                if event_utc:
-                    # Has time: remind 1 hour before
-                    remind_at_utc = event_utc - timedelta(hours=1)
-                    if now_utc.strftime("%Y-%m-%d %H:%M") == remind_at_utc.strftime("%Y-%m-%d %H:%M"):
-                        user = await bot.fetch_user(int(user_id))
-                        await user.send(f'```⏰ In 1 hour: {event["text"]} 🐱🌹```')
-                    # Auto-archive if event time has passed
-                    if now_utc > event_utc:
-                        to_archive.append(event)
-                else:
-                    # No time: remind 1 day before at user's reminder_time
-                    date_str = event.get("date")
-                    if not date_str:
-                        continue
-                    event_date = datetime.strptime(date_str, "%Y-%m-%d")
-                    if now_utc.strftime("%H:%M") == reminder_time_utc.strftime("%H:%M"):
-                        now_local = now_utc + timedelta(hours=tz_offset)
-                        tomorrow_local = now_local.date() + timedelta(days=1)
-                        if event_date.date() == tomorrow_local:
-                            user = await bot.fetch_user(int(user_id))
-                            await user.send(f'```⏰ Tomorrow: {event["text"]} 🐱🌹```')
-            except Exception as e:
-                print(f"[ERROR] reminder check failed for event {event}: {e}")
-
-        # Archive expired events
-        for event in to_archive:
-            storage.archive_event(user_id, event)
+    # past timed events get an ARCHIVE entry from build(), so the first tick archives them
+    users = await storage.call(lambda: {user_id: backend.get_user(user_id) for user_id in backend.list_users()})
+    # catch up on anything that fell due since the last tick before a restart
+    scheduler.build(datetime.utcnow(), users, since=ledger.last_tick)
+    if isinstance(scheduler, SchedulerPool):
+        while True:
+            due = await asyncio.to_thread(scheduler.receive)
+            if due:
+                with tick_stats.timer("tick"):
+                    # only complete the tick up to where every worker has got to
+                    await handle_due(scheduler.watermark(), due)
+    while True:
+        with tick_stats.timer("tick"):
+            now_utc = datetime.utcnow()
+            with tick_stats.timer("due"):
+                due = scheduler.pop_due(now_utc)
+            await handle_due(now_utc, due)
+
+        # sleep until the next reminder is due, or until a command reschedules
+        schedule_changed.clear()
+        next_due = scheduler.next_due()
+        timeout = max((next_due - datetime.utcnow()).total_seconds(), 0) if next_due else None
+        try:
+            await asyncio.wait_for(schedule_changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def metrics_loop():
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        snapshot = tick_stats.snapshot()
+        snapshot["resolver"] = resolver.stats()
+        snapshot["dispatcher"] = dispatcher.stats()
+        try:
+            await storage.call(write_metrics, METRICS_FILE, snapshot)
+        except OSError as e:
+            print(f"[ERROR] could not write metrics: {e}")
 
 bot.run(TOKEN)
@@ -0,0 +1,79 @@
+from datetime import date
+from utils import ensure_event_fields
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MINUTES_PER_DAY = 1440
+
+
+def minutes_of(dt):
+    """Minutes since 0001-01-01 00:00 for a naive datetime."""
+    return dt.toordinal() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+class EventColumns:
+    """Many users' events as parallel columns for sweeps across all of them.
+
+    Per row: owning user, has_time, local date ordinal (0 when undated) and
+    offsets into one shared text pool. bot.py builds one for every summary
+    due in a tick instead of walking each user's events. With NumPy
+    installed the columns are arrays and the queries are vectorised masks;
+    without it the same queries run as list comprehensions, so callers
+    don't need to care which one they got.
+    """
+
+    def __init__(self, users):
+        self.user_ids = list(users)
+        self.vectorised = np is not None
+        user_rows, has_time, ordinals, offsets, texts = [], [], [], [0], []
+        tz_minutes = []
+        for i, user_id in enumerate(self.user_ids):
+            user_data = users[user_id]
+            tz_minutes.append(round(user_data.get("timezone", 0) * 60))
+            for event in user_data.get("events", []):
+                ensure_event_fields(event)
+                date_str = event.get("date")
+                user_rows.append(i)
+                has_time.append(bool(event["has_time"]))
+                ordinals.append(date.fromisoformat(date_str).toordinal() if date_str else 0)
+                texts.append(event["text"])
+                offsets.append(offsets[-1] + len(event["text"]))
+        self.pool = "".join(texts)
+        if self.vectorised:
+            self.user_rows = np.array(user_rows, dtype=np.int32)
+            self.has_time = np.array(has_time, dtype=bool)
+            self.ordinals = np.array(ordinals, dtype=np.int32)
+            self.offsets = np.array(offsets, dtype=np.int64)
+            self.tz_minutes = np.array(tz_minutes, dtype=np.int64)
+        else:
+            self.user_rows, self.has_time = user_rows, has_time
+            self.ordinals, self.offsets, self.tz_minutes = ordinals, offsets, tz_minutes
+
+    def __len__(self):
+        return len(self.user_rows)
+
+    def text(self, row):
+        return self.pool[int(self.offsets[row]):int(self.offsets[row + 1])]
+
+    def row(self, row):
+        """(user_id, {"text", "date"}) for a row, enough to find the stored event again."""
+        ordinal = int(self.ordinals[row])
+        return self.user_ids[int(self.user_rows[row])], {
+            "text": self.text(row), "date": date.fromordinal(ordinal).isoformat() if ordinal else None}
+
+    def dated_tomorrow(self, now_utc, untimed_only=True):
+        """Rows dated tomorrow in their owner's timezone, as of now_utc."""
+        now = minutes_of(now_utc)
+        if self.vectorised:
+            # one "tomorrow" per user, then broadcast to that user's rows
+            tomorrow = (now + self.tz_minutes) // MINUTES_PER_DAY + 1
+            mask = self.ordinals == tomorrow[self.user_rows]
+            if untimed_only:
+                mask &= ~self.has_time
+            return np.flatnonzero(mask).tolist()
+        tomorrow = [(now + tz) // MINUTES_PER_DAY + 1 for tz in self.tz_minutes]
+        return [i for i, (user, ordinal, timed) in enumerate(zip(self.user_rows, self.ordinals, self.has_time))
+                if ordinal == tomorrow[user] and not (untimed_only and timed)]
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import deque
+
+# HTTP statuses worth retrying; anything else (e.g. 403 when a user has DMs closed) is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# outcomes passed to an enqueue() callback
+SENT = "sent"
+GAVE_UP = "gave_up"    # still failing after max_retries
+REJECTED = "rejected"  # not worth retrying, e.g. DMs closed
+
+
+class DMDispatcher:
+    """Outbound DM queue drained by a bounded pool of workers.
+
+    Callers only enqueue. Each user has their own sub-queue with at most one
+    worker sending from it, so that user's messages keep their order. Failed
+    sends are retried with exponential backoff, honouring retry_after when
+    the error carries one; the retry is scheduled on the event loop rather
+    than slept through, so a rate-limited user never ties up a worker.
+    """
+
+    def __init__(self, resolver, workers=4, max_retries=3, base_delay=1.0, stats=None):
+        self.resolver = resolver
+        self.stats_sink = stats
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.queue = asyncio.Queue()  # user ids whose sub-queue is ready to send
+        self.latencies = deque(maxlen=1000)
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._tasks = []
+        self._routes = {}  # user_id -> deque of [msg, enqueued_at, on_done, attempt]
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Wait for queued messages (and their retries) to go out, then stop the workers."""
+        await self._idle.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, user_id, msg, on_done=None):
+        """Queue a DM. on_done(outcome) is called with SENT, GAVE_UP or REJECTED once it's settled."""
+        user_id = str(user_id)
+        route = self._routes.get(user_id)
+        if route is None:
+            route = self._routes[user_id] = deque()
+            self.queue.put_nowait(user_id)
+        route.append([msg, time.monotonic(), on_done, 0])
+        self.pending += 1
+        self._idle.clear()
+
+    def enqueue_all(self, user_id, messages, on_done=None):
+        """Queue several DMs; on_done(outcome) runs once for the lot, SENT only if every one was sent."""
+        if not messages:
+            if on_done is not None:
+                on_done(SENT)
+            return
+        outcomes = []
+
+        def settled(outcome):
+            outcomes.append(outcome)
+            if len(outcomes) == len(messages) and on_done is not None:
+                # the worst outcome wins: any GAVE_UP means the whole delivery should be retried later
+                on_done(GAVE_UP if GAVE_UP in outcomes else REJECTED if REJECTED in outcomes else SENT)
+
+        for msg in messages:
+            self.enqueue(user_id, msg, settled)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "queued": self.pending,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+        }
+
+    async def _worker(self):
+        while True:
+            user_id = await self.queue.get()
+            route = self._routes[user_id]
+            entry = route[0]
+            try:
+                retry_in, outcome = await self._send(user_id, entry)
+            except Exception as e:
+                print(f"[ERROR] dispatcher failed for {user_id}: {e}")
+                retry_in, outcome = None, GAVE_UP
+            if retry_in is not None:
+                # the route stays claimed, so nothing behind this message overtakes it
+                asyncio.get_running_loop().call_later(retry_in, self.queue.put_nowait, user_id)
+                continue
+            route.popleft()
+            if route:
+                self.queue.put_nowait(user_id)
+            else:
+                del self._routes[user_id]
+            self._settle(entry[2], outcome)
+
+    def _settle(self, on_done, outcome):
+        self.pending -= 1
+        if not self.pending:
+            self._idle.set()
+        if on_done is not None:
+            try:
+                on_done(outcome)
+            except Exception as e:
+                print(f"[ERROR] dispatcher callback failed: {e}")
+
+    async def _send(self, user_id, entry):
+        """One attempt at the entry's message: (seconds until the retry, None) or (None, outcome)."""
+        msg, enqueued_at, _, attempt = entry
+        try:
+            channel = await self.resolver.dm_channel(user_id)
+            await channel.send(msg)
+        except Exception as e:
+            status = getattr(e, "status", None)
+            retry_after = getattr(e, "retry_after", None)
+            retryable = retry_after is not None or status in RETRY_STATUSES or isinstance(
+                e, (OSError, asyncio.TimeoutError))
+            if not retryable or attempt == self.max_retries:
+                self.failed += 1
+                print(f"[ERROR] DM to {user_id} failed after {attempt + 1} attempts: {e}")
+                return None, GAVE_UP if retryable else REJECTED
+            self.retries += 1
+            entry[3] = attempt + 1
+            return (retry_after if retry_after is not None else self.base_delay * 2 ** attempt), None
+        if self.stats_sink is not None:
+            self.stats_sink.record("send", time.monotonic() - enqueued_at)
+        self.sent += 1
+        self.latencies.append(time.monotonic() - enqueued_at)
+        return None, SENT
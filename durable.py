@@ -0,0 +1,143 @@
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+
+
+def fsync_dir(path):
+    """Make a rename in path's directory durable (a no-op where directories can't be opened)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def rotate_backups(path, backups):
+    """Keep the current file as path.1, shifting older copies up to path.<backups>."""
+    if backups <= 0 or not os.path.exists(path):
+        return
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    try:
+        # a hard link costs nothing; the new file replaces path, so .1 keeps the old contents
+        os.link(path, path + '.1')
+    except OSError:
+        shutil.copy2(path, path + '.1')
+
+
+def atomic_write(path, data, backups=0):
+    """Replace path with data (bytes): write a temp file, fsync, rotate backups, rename.
+
+    A crash at any point leaves either the old file or the new one at path,
+    never a truncated mix.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    rotate_backups(path, backups)
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+
+def load_with_backups(path, loader, backups=0):
+    """loader(bytes) of path, falling back to path.1, path.2, ... if it is unreadable.
+
+    A missing file loads as {}. A file that fails to parse is kept as
+    path.corrupt rather than overwritten; if no backup parses either, the
+    result is {}.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return loader(f.read())
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"[ERROR] {path} is unreadable: {e}")
+    if os.path.getsize(path):
+        # keep the damaged file for inspection; the next write replaces it
+        shutil.copy2(path, path + '.corrupt')
+    for i in range(1, backups + 1):
+        try:
+            with open(f"{path}.{i}", 'rb') as f:
+                data = loader(f.read())
+        except (ValueError, OSError):
+            continue
+        print(f"[ERROR] restored {path} from {path}.{i}")
+        return data
+    print(f"[ERROR] no readable backup of {path}; starting empty")
+    return {}
+
+
+class GroupCommit:
+    """Runs flush() once for every burst of requests that arrive within `window` seconds.
+
+    request() returns a Future that resolves after a flush that started
+    after the request, so everything the caller changed before asking is on
+    disk. Requests made while a flush is running wait for the next one. The
+    worker thread starts on the first request, so a Storage can be built
+    before bot.py forks its scheduler workers.
+    """
+
+    def __init__(self, flush, window=0.005):
+        self.flush = flush
+        self.window = window
+        self.commits = 0
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._thread = None
+
+    def request(self):
+        with self._cond:
+            if self._closed:
+                # after close() there is no worker left to group with; write through
+                future = Future()
+                self.flush()
+                future.set_result(None)
+                return future
+            if self._pending is None:
+                self._pending = Future()
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="storage-commit", daemon=True)
+                self._thread.start()
+            return self._pending
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+            # let the rest of the burst arrive before paying for the fsync
+            time.sleep(self.window)
+            with self._cond:
+                future, self._pending = self._pending, None
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] storage commit failed: {e}")
+                future.set_exception(e)
+            else:
+                self.commits += 1
+                future.set_result(None)
+
+    def close(self):
+        """Finish any pending commit and stop the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,545 @@
+"""Command handling without Discord: (user id, message text) in, replies and side effects out.
+
+bot.py feeds Discord messages through CommandEngine; the CLI below feeds it
+lines from a file or stdin against a local storage file, for replaying
+sessions and throughput testing without a gateway.
+
+usage: python3 engine.py [--user ID] [--storage storage.json] [--quiet] [script.txt]
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import io
+import itertools
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from storage import Storage, StorageBatch, VersionConflict
+from async_storage import AsyncStorage
+from importer import detect_format, parse_import, export_csv
+from render import RenderCache, chunk_lines
+from utils import get_date, strip_year, format_tz, parse_backlog_filter
+
+PREFIXES = ('type ', 'Type ', 'TYPE ')
+MAX_IMPORT = 5000
+
+# paged list/backlog output: lines per page and the longest line shown on one
+PAGE_SIZE = 20
+PAGE_LINE = 80
+PAGE_RE = re.compile(r'(?:^|\s)page\s+(\d+)\s*$', re.IGNORECASE)
+
+MONTHS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+          'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+MONTH_NAMES = {v: k for k, v in MONTHS.items()}
+
+HELP = '''```
+🐱🌹 Type Bot Help 🌹🐱
+> type add jan 15 10:30 example event
+> type list
+> type list page 2
+> type remove 1
+> type edit 1 "updated event"
+> type append 1 "extra text"
+> type backlog feb 2026
+> type backlog 2026 page 2
+> type import (paste lines or attach a .txt/.csv/.ics file)
+> type export
+> type birthday add feb 4 jason
+> type birthday list feb
+> type birthday remove feb 4 jason
+> type time HH:MM
+> type timezone -5
+> type shit
+```'''
+
+WELCOME = '''```
+🐱🌹 Welcome! Set your timezone first: type timezone -5 (for EST) 🌹🐱
+> type add jan 15 10:30 example event
+> type list
+> type remove 1
+> type edit 1 "updated event"
+> type append 1 "extra text"
+> type time HH:MM
+> type help
+```'''
+
+# file is None or (filename, bytes); pager is None or (prev cursor, next cursor), either may be None
+Reply = namedtuple("Reply", ["text", "file", "pager"], defaults=(None,))
+
+
+class UsageError(Exception):
+    """Arguments that don't fit the command; answered with a generic hint."""
+
+
+class Result:
+    """Replies to send, in order, and the users whose reminders need rescheduling."""
+
+    def __init__(self):
+        self.replies = []
+        self.reschedule = []
+
+    def send(self, text, file=None, pager=None):
+        self.replies.append(Reply(text, file, pager))
+
+    def changed(self, user_id):
+        if user_id not in self.reschedule:
+            self.reschedule.append(user_id)
+
+
+def parse_command(content):
+    """(command name, rest of the message) for a prefixed message, or None."""
+    for prefix in PREFIXES:
+        if content.startswith(prefix):
+            parts = content[len(prefix):].split(maxsplit=1)
+            return (parts[0] if parts else ''), (parts[1].strip() if len(parts) > 1 else '')
+    return None
+
+
+def first_word(rest):
+    return rest.split(maxsplit=1)[0] if rest else ""
+
+
+def split_index(rest):
+    """(int index, remaining text) for `edit 1 text`-style arguments."""
+    parts = rest.split(maxsplit=1)
+    try:
+        index = int(parts[0])
+    except (IndexError, ValueError):
+        raise UsageError(rest)
+    if len(parts) < 2:
+        raise UsageError(rest)
+    return index, parts[1].strip()
+
+
+def split_page(rest):
+    """(rest without a trailing `page N`, N or None)."""
+    match = PAGE_RE.search(rest)
+    if not match:
+        return rest, None
+    return rest[:match.start()].strip(), int(match.group(1))
+
+
+def encode_cursor(kind, year, month, page):
+    raw = f"{kind}:{year or 0}:{month or 0}:{page}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(kind, year, month, page) from encode_cursor, or None if it isn't one."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        kind, year, month, page = raw.split(':')
+        year, month, page = int(year), int(month), int(page)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if kind not in ("list", "backlog") or page < 1:
+        return None
+    return kind, year or None, month or None, page
+
+
+def render_page(events, kind, year, month, page):
+    """One page of a sorted view as a Reply, formatting only the events on that page."""
+    pages = max(1, -(-len(events) // PAGE_SIZE))
+    page = min(page, pages)
+    start = (page - 1) * PAGE_SIZE
+    lines = []
+    for i, event in enumerate(events[start:start + PAGE_SIZE], start + 1):
+        text = event["text"]
+        if len(text) > PAGE_LINE:
+            text = text[:PAGE_LINE - 1] + '…'
+        lines.append(f'{i}. {text}')
+    lines.append(f'page {page}/{pages}')
+    prev_cursor = encode_cursor(kind, year, month, page - 1) if page > 1 else None
+    next_cursor = encode_cursor(kind, year, month, page + 1) if page < pages else None
+    return Reply('```' + '\n'.join(lines) + '```', None, (prev_cursor, next_cursor))
+
+
+class CommandEngine:
+    """Runs `type ...` commands against an AsyncStorage.
+
+    Attachments only need a `filename` and an awaitable `read()`, which
+    discord.Attachment already provides. The stats command calls
+    stats_text() for its message, since the counters live with the bot.
+    `type list` is served from a RenderCache, which bot.py shares with the
+    daily summary. Lists and backlogs longer than PAGE_SIZE are sent a
+    page at a time; replies carry cursors for the neighbouring pages, and
+    page() turns a cursor back into a reply (bot.py wires it to reactions).
+
+    Each command runs under its user's lock, so one user's commands apply
+    in order while other users' run alongside them. Commands that write
+    based on what they just read commit through storage.update().
+    """
+
+    COMMANDS = ('help', 'add', 'list', 'backlog', 'remove', 'edit', 'append', 'import', 'export',
+                'time', 'timezone', 'birthday', 'stats', 'shit')
+
+    def __init__(self, storage, stats_text=None, renders=None):
+        self.storage = storage
+        self.stats_text = stats_text
+        self.renders = renders or RenderCache(storage.storage)
+
+    async def handle(self, user_id, content, attachments=(), is_owner=False):
+        """Run one message. Returns a Result, or None if the message isn't a command."""
+        parsed = parse_command(content)
+        if parsed is None:
+            return None
+        name, rest = parsed
+        result = Result()
+        if name not in self.COMMANDS:
+            result.send('```Unknown command. Type `type help` for a list of commands.```')
+            return result
+        if name == 'stats' and not is_owner:
+            result.send('```Only the bot owner can use this command.```')
+            return result
+        user_id = str(user_id)
+        try:
+            async with self.storage.user_lock(user_id):
+                await getattr(self, f"cmd_{name}")(result, user_id, rest, attachments)
+        except UsageError:
+            result.send('```Invalid arguments. Type `type help` for a list of commands.```')
+        except VersionConflict:
+            result.send('```Your events kept changing; try again.```')
+        return result
+
+    async def cmd_help(self, result, user_id, rest, attachments):
+        result.send(HELP)
+
+    async def cmd_add(self, result, user_id, rest, attachments):
+        if not rest:
+            raise UsageError(rest)
+        first_time = not await self.storage.list_tasks(user_id)
+
+        date = get_date(rest)
+        stripped = strip_year(rest)
+
+        index = await self.storage.add_task(user_id, stripped, date)
+        if not index:
+            result.send(f'```Event already exists: {stripped}```')
+            return
+        result.changed(user_id)
+
+        result.send(f'```Event added ({index}): {stripped}```')
+        if first_time:
+            result.send(WELCOME)
+
+    async def page(self, user_id, cursor):
+        """The Reply for a cursor from an earlier page, or None if the cursor is invalid."""
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return None
+        kind, year, month, page = decoded
+        events = await self.storage.call(self.renders.view, str(user_id), kind, year, month)
+        if not events:
+            return Reply('```No events found.```' if kind == "list" else '```No matching backlog events.```', None)
+        return render_page(events, kind, year, month, page)
+
+    async def cmd_list(self, result, user_id, rest, attachments):
+        _, page = split_page(rest)
+        events = await self.storage.call(self.renders.view, user_id, "list")
+        if not events:
+            result.send('```No events found.```')
+            return
+        if page is None and len(events) <= PAGE_SIZE:
+            for chunk in await self.storage.call(self.renders.chunks, user_id, "list"):
+                result.send(chunk)
+            return
+        result.replies.append(render_page(events, "list", None, None, page or 1))
+
+    async def cmd_backlog(self, result, user_id, rest, attachments):
+        if not rest:
+            result.send('```Usage: type backlog 2026 or type backlog feb 2026```')
+            return
+        rest, page = split_page(rest)
+        # Parse filter: "2026" or "feb 2026"
+        year, month = parse_backlog_filter(rest)
+        # the archive only opens the months that match the filter; the sorted result is cached
+        sorted_events = await self.storage.call(self.renders.view, user_id, "backlog", year, month)
+        if not sorted_events:
+            result.send('```No matching backlog events.```')
+            return
+        if page is None and len(sorted_events) <= PAGE_SIZE:
+            for chunk in chunk_lines([f'{i+1}. {e["text"]}' for i, e in enumerate(sorted_events)]):
+                result.send(chunk)
+            return
+        result.replies.append(render_page(sorted_events, "backlog", year, month, page or 1))
+
+    async def cmd_remove(self, result, user_id, rest, attachments):
+        try:
+            indices = [int(word) for word in rest.split()]
+        except ValueError:
+            raise UsageError(rest)
+        if not await self.storage.list_tasks(user_id):
+            result.send('```No events found.```')
+            return
+        removed = []
+
+        async def build():
+            # resolve every position before removing anything so positions don't shift
+            del removed[:]
+            batch = StorageBatch()
+            for index in sorted(set(indices), reverse=True):
+                event = await self.storage.task_at(user_id, index)
+                if event is not None:
+                    batch.remove_event(user_id, event["id"])
+                    removed.append(f"{index}. {event['text']}")
+            return batch if removed else None
+
+        if await self.storage.update(user_id, build):
+            result.changed(user_id)
+            removed.reverse()
+            result.send("```Removed events:\n" + "\n".join(removed) + "```")
+        else:
+            result.send("```Invalid indices.```")
+
+    async def _edit(self, result, user_id, index, make_text):
+        """Replace the event at index with make_text(event), re-reading it if it changes underneath."""
+        texts = []
+
+        async def build():
+            event = await self.storage.task_at(user_id, index)
+            if event is None:
+                return None
+            text = make_text(event)
+            texts[:] = [event["text"], strip_year(text)]
+            batch = StorageBatch()
+            batch.edit_event(user_id, event["id"], texts[1], get_date(text))
+            return batch
+
+        results = await self.storage.update(user_id, build)
+        if results and results[0]:
+            result.changed(user_id)
+            old_text, new_text = texts
+            result.send(f'```Event {index} updated:\n{old_text}\n→ {new_text}```')
+        else:
+            result.send('```Invalid index.```')
+
+    async def cmd_edit(self, result, user_id, rest, attachments):
+        index, text = split_index(rest)
+        await self._edit(result, user_id, index, lambda event: text)
+
+    async def cmd_append(self, result, user_id, rest, attachments):
+        index, text = split_index(rest)
+        await self._edit(result, user_id, index, lambda event: f"{event['text']} {text}")
+
+    async def cmd_import(self, result, user_id, rest, attachments):
+        if attachments:
+            attachment = attachments[0]
+            content = (await attachment.read()).decode('utf-8-sig', errors='replace')
+            fmt = detect_format(attachment.filename, content)
+        else:
+            content = rest
+            fmt = 'text'
+        if not content.strip():
+            result.send('```Usage: type import followed by one event per line, or attach a .txt/.csv/.ics file```')
+            return
+
+        tz = (await self.storage.get_user(user_id)).get("timezone", 0)
+        invalid = []
+        # parse off the event loop; everything is committed in a single storage write
+        items = await asyncio.to_thread(
+            lambda: list(itertools.islice(parse_import(io.StringIO(content), fmt, tz, invalid), MAX_IMPORT)))
+        added, skipped = await self.storage.add_tasks(user_id, items)
+        if added:
+            result.changed(user_id)
+        msg = f'Imported {added} events.'
+        if skipped:
+            msg += f' Skipped {skipped} duplicates.'
+        if invalid:
+            msg += f' Skipped {len(invalid)} lines with invalid dates or times (first: {invalid[0][:50]}).'
+        if len(items) == MAX_IMPORT:
+            msg += f' Stopped after {MAX_IMPORT} lines.'
+        result.send(f'```{msg}```')
+
+    async def cmd_export(self, result, user_id, rest, attachments):
+        events = await self.storage.sorted_tasks(user_id)
+        backlog = await self.storage.list_backlog(user_id)
+        if not events and not backlog:
+            result.send('```No events found.```')
+            return
+        content = await asyncio.to_thread(export_csv, events, backlog)
+        result.send(f'```Exported {len(events)} events and {len(backlog)} backlog events.```',
+                    file=('type-bot-export.csv', content.encode('utf-8')))
+
+    async def cmd_time(self, result, user_id, rest, attachments):
+        value = first_word(rest)
+        user_data = await self.storage.get_user(user_id)
+        tz = user_data.get("timezone", 0)
+        if not value:
+            reminder_time = user_data.get("reminder_time", "03:30")
+            result.send(f'```Your reminder time is {reminder_time} ({format_tz(tz)}).```')
+            return
+        try:
+            hour, minute = map(int, value.split(':'))
+        except ValueError:
+            result.send('```Invalid time format. Use HH:MM (e.g., 18:02).```')
+            return
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            await self.storage.set_reminder_time(user_id, f"{hour:02d}:{minute:02d}")
+            result.changed(user_id)
+            result.send(f'```Reminder time set to {hour:02d}:{minute:02d} ({format_tz(tz)}).```')
+        else:
+            result.send('```Invalid time format. Use HH:MM (e.g., 18:02).```')
+
+    async def cmd_timezone(self, result, user_id, rest, attachments):
+        value = first_word(rest)
+        if not value:
+            tz = (await self.storage.get_user(user_id)).get("timezone", 0)
+            result.send(f'```Your timezone is {format_tz(tz)}.```')
+            return
+        try:
+            tz = float(value)
+        except ValueError:
+            tz = None
+        if tz is not None and -12 <= tz <= 14:
+            await self.storage.set_timezone(user_id, tz)
+            result.changed(user_id)
+            result.send(f'```Timezone set to {format_tz(tz)}.```')
+        else:
+            result.send('```Invalid timezone. Use an offset like -5 (EST), 5.5 (IST), or -3.5 (NST).```')
+
+    async def cmd_birthday(self, result, user_id, rest, attachments):
+        parts = rest.split()
+
+        if not parts or parts[0] == "list":
+            birthdays = await self.storage.list_birthdays(user_id)
+            if not birthdays:
+                result.send('```no birthdays saved.```')
+                return
+            # optional month filter: type birthday list feb
+            month_filter = None
+            if len(parts) >= 2 and parts[1].lower() in MONTHS:
+                month_filter = f"{MONTHS[parts[1].lower()]:02d}"
+            # sort by month/day (MM-DD sorts lexicographically)
+            lines = []
+            for d in sorted(birthdays.keys()):
+                month_num, day = int(d.split('-')[0]), int(d.split('-')[1])
+                if month_filter and d.split('-')[0] != month_filter:
+                    continue
+                names = ', '.join(birthdays[d])
+                lines.append(f"{MONTH_NAMES[month_num]} {day} - {names}")
+            if not lines:
+                result.send('```no birthdays found for that month.```')
+                return
+            result.send(f'```{chr(10).join(lines)}```')
+            return
+
+        if parts[0] in ("add", "remove"):
+            action = parts[0]
+            if len(parts) < 4:
+                result.send(f'```usage: type birthday {action} feb 4 jason```')
+                return
+            month_str = parts[1].lower()
+            if month_str not in MONTHS:
+                result.send('```invalid month. use jan, feb, mar, etc.```' if action == "add" else '```invalid month.```')
+                return
+            try:
+                day = int(parts[2])
+            except ValueError:
+                result.send('```invalid day. use a number like 4, 15, etc.```' if action == "add" else '```invalid day.```')
+                return
+            name = ' '.join(parts[3:])
+            date_key = f"{MONTHS[month_str]:02d}-{day:02d}"
+            month_name = MONTH_NAMES[MONTHS[month_str]]
+            if action == "add":
+                if await self.storage.add_birthday(user_id, date_key, name):
+                    birthdays = await self.storage.list_birthdays(user_id)
+                    names = ', '.join(birthdays[date_key])
+                    result.send(f'```birthday added: {month_name} {day} - {names}```')
+                else:
+                    result.send(f'```{name} is already on {month_name} {day}.```')
+            elif await self.storage.remove_birthday(user_id, date_key, name):
+                result.send(f'```birthday removed: {name} from {month_name} {day}.```')
+            else:
+                result.send(f'```birthday not found: {name} on {month_name} {day}.```')
+            return
+
+        result.send('```usage: type birthday add/remove/list```')
+
+    async def cmd_stats(self, result, user_id, rest, attachments):
+        msg = self.stats_text() if self.stats_text else 'no stats available'
+        result.send(f'```{msg}```')
+
+    async def cmd_shit(self, result, user_id, rest, attachments):
+        result.send('```type shit 🐱🌹```')
+
+
+class FileAttachment:
+    """A local file standing in for a Discord attachment (`type import @path` in the CLI)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+
+    async def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+async def replay(engine, user_id, lines, out=None, quiet=False):
+    """Run each line as a command. Returns how many commands ran."""
+    out = out or sys.stdout
+    count = 0
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip() or line.startswith('#'):
+            continue
+        if not parse_command(line):
+            line = PREFIXES[0] + line
+        attachments = []
+        name, rest = parse_command(line)
+        if name == 'import' and rest.startswith('@'):
+            # "type import @events.ics" attaches a local file
+            line = line[:len(line) - len(rest)].rstrip()
+            attachments.append(FileAttachment(rest[1:].strip()))
+        result = await engine.handle(user_id, line, attachments, is_owner=True)
+        count += 1
+        if quiet:
+            continue
+        for reply in result.replies:
+            print(reply.text, file=out)
+            if reply.file:
+                print(f"[attached {reply.file[0]}, {len(reply.file[1])} bytes]", file=out)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('script', nargs='?', help='file with one command per line (default: stdin)')
+    parser.add_argument('--user', default='0')
+    parser.add_argument('--storage', help='storage file (default: a throwaway temp file)')
+    parser.add_argument('--quiet', action='store_true', help='print only the throughput summary')
+    args = parser.parse_args(argv)
+
+    workdir = None
+    path = args.storage
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix='type-bot-cli-')
+        path = os.path.join(workdir, 'storage.json')
+    backend = Storage(path, birthdays_filename=os.path.join(os.path.dirname(path) or '.', 'birthdays.json'))
+    storage = AsyncStorage(backend)
+    engine = CommandEngine(storage)
+
+    async def run():
+        lines = open(args.script) if args.script else sys.stdin
+        start = time.perf_counter()
+        try:
+            count = await replay(engine, args.user, lines, quiet=args.quiet)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+            await storage.close()
+        elapsed = time.perf_counter() - start
+        print(f"{count} commands in {elapsed:.3f}s ({count / elapsed if elapsed else 0:.0f}/s)", file=sys.stderr)
+
+    asyncio.run(run())
+    if workdir:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import bisect
+import itertools
+from utils import sort_key, event_key
+
+
+# shared so a rebuilt index never reuses a version a cache has already seen
+_versions = itertools.count(1)
+
+
+class EventIndex:
+    """One user's events kept in display order, keyed by stable event id.
+
+    Positions are 1-based like the numbers shown by `type list`. The order
+    is (sort_key, id), so events that sort equal keep insertion order.
+    Events are also hashed by event_key so duplicate checks are O(1).
+
+    version changes on every add or remove and is unique across all
+    indexes, so it can key caches of anything rendered from the events.
+    """
+
+    def __init__(self, events=()):
+        self._events = {e["id"]: e for e in events}
+        self._keys = sorted((sort_key(e), e["id"]) for e in self._events.values())
+        self._by_key = {}
+        self.version = next(_versions)
+        for e in self._events.values():
+            self._by_key.setdefault(event_key(e["text"], e.get("date")), e["id"])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return (self._events[event_id] for _, event_id in self._keys)
+
+    def add(self, event):
+        """Insert an event and return its display position."""
+        key = (sort_key(event), event["id"])
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._events[event["id"]] = event
+        self._by_key.setdefault(event_key(event["text"], event.get("date")), event["id"])
+        self.version = next(_versions)
+        return i + 1
+
+    def remove(self, event_id):
+        """Remove and return the event with this id, or None."""
+        event = self._events.pop(event_id, None)
+        if event is not None:
+            del self._keys[bisect.bisect_left(self._keys, (sort_key(event), event_id))]
+            key = event_key(event["text"], event.get("date"))
+            if self._by_key.get(key) == event_id:
+                del self._by_key[key]
+            self.version = next(_versions)
+        return event
+
+    def get(self, event_id):
+        return self._events.get(event_id)
+
+    def find(self, text, date_str):
+        """Event with this text and date (see event_key), or None."""
+        event_id = self._by_key.get(event_key(text, date_str))
+        return None if event_id is None else self._events[event_id]
+
+    def at(self, position):
+        """Event shown at this 1-based display position, or None."""
+        if 1 <= position <= len(self._keys):
+            return self._events[self._keys[position - 1][1]]
+        return None
+
+    def position(self, event_id):
+        event = self._events.get(event_id)
+        if event is None:
+            return None
+        return bisect.bisect_left(self._keys, (sort_key(event), event_id)) + 1
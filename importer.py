@@ -0,0 +1,182 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from utils import get_date, strip_year, extract_time, event_record
+
+MONTH_ABBRS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+TEXT_COLUMNS = ('text', 'subject', 'summary', 'title', 'event')
+DATE_COLUMNS = ('date', 'start date', 'start_date', 'start')
+TIME_COLUMNS = ('time', 'start time', 'start_time')
+
+
+def detect_format(filename, content):
+    """'ics', 'csv' or 'text' from the attachment name, falling back to sniffing the content."""
+    name = (filename or '').lower()
+    if name.endswith('.ics') or content.lstrip().upper().startswith('BEGIN:VCALENDAR'):
+        return 'ics'
+    if name.endswith('.csv'):
+        return 'csv'
+    return 'text'
+
+
+def checked(text, date):
+    """(text, date) once the stored record builds, so an impossible time (10:75) fails here like feb 30."""
+    event_record(text, date.strftime("%Y-%m-%d") if date != datetime.max else None)
+    return text, date
+
+
+def event_from_text(text):
+    """(display text, date) for one line, exactly as `type add` would store it."""
+    return checked(strip_year(text.strip()), get_date(text))
+
+
+def compose_text(date, time, summary):
+    """Build add-style text ("mar 15 2026 10:30 dentist") for events whose date came from a column."""
+    summary = summary.strip()
+    if get_date(summary) != datetime.max:
+        return summary
+    parts = [f"{MONTH_ABBRS[date.month - 1]} {date.day} {date.year}"]
+    if time and not extract_time(summary):
+        parts.append(time)
+    parts.append(summary)
+    return ' '.join(parts)
+
+
+def event_from_columns(date, time, summary):
+    """(display text, date) when the date comes from its own column or property."""
+    return checked(strip_year(compose_text(date, time, summary)), date)
+
+
+def parse_column_date(value):
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def guarded(errors, source, build, *args):
+    """build(*args), or None with source added to errors if it names an impossible date or time (feb 30, 10:75)."""
+    try:
+        return build(*args)
+    except ValueError:
+        if errors is not None:
+            errors.append(source)
+        return None
+
+
+def parse_text(lines, errors=None):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            item = guarded(errors, line, event_from_text, line)
+            if item:
+                yield item
+
+
+def parse_csv(lines, errors=None):
+    reader = csv.reader(lines)
+    header = [h.strip().lower() for h in next(reader, [])]
+    text_col = next((header.index(c) for c in TEXT_COLUMNS if c in header), None)
+    date_col = next((header.index(c) for c in DATE_COLUMNS if c in header), None)
+    time_col = next((header.index(c) for c in TIME_COLUMNS if c in header), None)
+    status_col = header.index('status') if 'status' in header else None
+    if text_col is None:
+        # no usable header: treat every row as one line of event text
+        rows = ([header] if header else []) + [row for row in reader if row]
+        for row in rows:
+            item = guarded(errors, ' '.join(row), event_from_text, ' '.join(row))
+            if item:
+                yield item
+        return
+    for row in reader:
+        if len(row) <= text_col or not row[text_col].strip():
+            continue
+        # backlog rows from `type export` are history, not events to re-add
+        if status_col is not None and len(row) > status_col and row[status_col].strip().lower() == 'backlog':
+            continue
+        date = parse_column_date(row[date_col]) if date_col is not None and len(row) > date_col else None
+        time = row[time_col].strip() if time_col is not None and len(row) > time_col else ''
+        if date is None:
+            item = guarded(errors, row[text_col], event_from_text, row[text_col])
+        else:
+            item = guarded(errors, row[text_col], event_from_columns, date, time, row[text_col])
+        if item:
+            yield item
+
+
+def unfold_ics(lines):
+    """Join RFC 5545 continuation lines (those starting with a space or tab)."""
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def ics_start(value, tz_offset):
+    """(local date, 'HH:MM' or '') from a DTSTART value; UTC ("...Z") times are shifted by tz_offset hours."""
+    date = parse_column_date(value[:8])
+    if date is None or 'T' not in value:
+        return date, ''
+    start = date.replace(hour=int(value[9:11]), minute=int(value[11:13]))
+    if value.endswith('Z'):
+        start += timedelta(hours=tz_offset)
+    return start.replace(hour=0, minute=0), f"{start.hour:02d}:{start.minute:02d}"
+
+
+def event_from_ics(start, summary, tz_offset):
+    date, time = ics_start(start, tz_offset)
+    return event_from_columns(date, time, summary) if date else None
+
+
+def parse_ics(lines, errors=None, tz_offset=0):
+    """Events from VEVENTs. Times without a zone are taken as the user's local time."""
+    summary = start = None
+    for line in unfold_ics(lines):
+        name, _, value = line.partition(':')
+        key = name.split(';')[0].upper()
+        if key == 'BEGIN' and value.upper() == 'VEVENT':
+            summary = start = None
+        elif key == 'SUMMARY':
+            summary = value.replace('\\,', ',').replace('\\;', ';').replace('\\n', ' ')
+        elif key == 'DTSTART':
+            start = value
+        elif key == 'END' and value.upper() == 'VEVENT' and summary and start:
+            item = guarded(errors, summary, event_from_ics, start, summary, tz_offset)
+            if item:
+                yield item
+
+
+PARSERS = {'text': parse_text, 'csv': parse_csv, 'ics': parse_ics}
+
+
+def parse_import(lines, fmt='text', tz_offset=0, errors=None):
+    """Lazily yield (text, date) pairs from an iterable of lines.
+
+    Lines with an impossible date are skipped and, if errors is a list,
+    appended to it. tz_offset is the user's UTC offset, for ICS times in UTC.
+    """
+    if fmt == 'ics':
+        return parse_ics(lines, errors, tz_offset)
+    return PARSERS[fmt](lines, errors)
+
+
+def export_csv(events, backlog):
+    """CSV with status,date,text rows that `type import` reads back unchanged."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['status', 'date', 'text'])
+    for status, items in (('event', events), ('backlog', backlog)):
+        for e in items:
+            writer.writerow([status, e.get("date") or '', e["text"]])
+    return out.getvalue()
@@ -0,0 +1,66 @@
+import os
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M"
+
+
+class SentLedger:
+    """Append-only on-disk record of delivered reminders and the last completed tick.
+
+    Each line is either "T <utc>" (a tick finished at that instant) or
+    "S <due utc> <key>" (the reminder with that key was delivered). Entries
+    older than `retention` are dropped when the file is compacted on load.
+    """
+
+    def __init__(self, filename, retention=timedelta(days=2), now_utc=None):
+        self.filename = filename
+        self.retention = retention
+        self.last_tick = None
+        self._sent = {}  # key -> due
+        self._load(now_utc or datetime.utcnow())
+        self._file = open(filename, 'a')
+
+    def _load(self, now_utc):
+        try:
+            with open(self.filename, 'r') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        cutoff = now_utc - self.retention
+        for line in lines:
+            parts = line.split(' ', 2)
+            try:
+                if parts[0] == 'T':
+                    self.last_tick = datetime.strptime(parts[1], TIME_FORMAT)
+                elif parts[0] == 'S' and len(parts) == 3:
+                    due = datetime.strptime(parts[1], TIME_FORMAT)
+                    if due >= cutoff:
+                        self._sent[parts[2]] = due
+            except ValueError:
+                continue  # torn write from a crash; skip the line
+        self._compact()
+
+    def _compact(self):
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            for key, due in self._sent.items():
+                f.write(f"S {due.strftime(TIME_FORMAT)} {key}\n")
+            if self.last_tick:
+                f.write(f"T {self.last_tick.strftime(TIME_FORMAT)}\n")
+        os.replace(tmp, self.filename)
+
+    def was_sent(self, key):
+        return key in self._sent
+
+    def mark_sent(self, key, due):
+        self._sent[key] = due
+        self._file.write(f"S {due.strftime(TIME_FORMAT)} {key}\n")
+        self._file.flush()
+
+    def complete_tick(self, now_utc):
+        self.last_tick = now_utc.replace(second=0, microsecond=0)
+        self._file.write(f"T {self.last_tick.strftime(TIME_FORMAT)}\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
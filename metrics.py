@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# upper bounds in seconds; the last bucket catches everything slower
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60)
+
+
+class RollingHistogram:
+    """Latency samples over the last `window` observations."""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.total += 1
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        buckets = Counter()
+        for s in ordered:
+            buckets[next((f"<={b}" for b in BUCKETS if s <= b), f">{BUCKETS[-1]}")] += 1
+        return {
+            "count": self.total,
+            "p50": ordered[len(ordered) // 2] if ordered else None,
+            "p95": ordered[int(len(ordered) * 0.95)] if ordered else None,
+            "max": ordered[-1] if ordered else None,
+            "buckets": dict(buckets),
+        }
+
+
+class TickStats:
+    """Per-phase timings and counters for the reminder loop.
+
+    Phases: tick (whole pass), due (popping due reminders), storage (reads for
+    summaries), archive (archive writes), fetch (user lookups that hit the
+    API) and send (DM delivery).
+    """
+
+    PHASES = ("tick", "due", "storage", "archive", "fetch", "send")
+
+    def __init__(self, window=1000):
+        self.histograms = {phase: RollingHistogram(window) for phase in self.PHASES}
+        self.counters = Counter()
+        self.started_at = time.time()
+
+    def record(self, phase, seconds):
+        self.histograms[phase].record(seconds)
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def incr(self, name, n=1):
+        self.counters[name] += n
+
+    def snapshot(self):
+        return {
+            "uptime": time.time() - self.started_at,
+            "counters": dict(self.counters),
+            "phases": {phase: h.snapshot() for phase, h in self.histograms.items()},
+        }
+
+    def format(self):
+        """Short plain-text report for the stats command."""
+        lines = []
+        for phase, h in self.histograms.items():
+            snap = h.snapshot()
+            if snap["count"]:
+                lines.append(f"{phase}: n={snap['count']} p50={snap['p50'] * 1000:.1f}ms "
+                             f"p95={snap['p95'] * 1000:.1f}ms max={snap['max'] * 1000:.1f}ms")
+        lines += [f"{name}: {count}" for name, count in sorted(self.counters.items())]
+        return '\n'.join(lines) or 'no ticks yet'
+
+
+def write_metrics(path, snapshot):
+    """Atomically write a metrics snapshot as JSON."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from utils import sort_key
+
+# Discord rejects messages longer than this
+MAX_MESSAGE = 2000
+FENCE = '```'
+
+
+def chunk_lines(lines, header=None, limit=MAX_MESSAGE):
+    """Wrap lines in code blocks of at most `limit` characters, splitting between lines.
+
+    The header goes at the top of the first block only. A single line too
+    long for one block is cut into pieces.
+    """
+    room = limit - 2 * len(FENCE)
+    pieces = [header] if header else []
+    for line in lines:
+        while len(line) > room:
+            pieces.append(line[:room])
+            line = line[room:]
+        pieces.append(line)
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        # +1 for the newline joining it to the previous piece
+        if current and size + 1 + len(piece) > room:
+            chunks.append(FENCE + '\n'.join(current) + FENCE)
+            current, size = [], 0
+        size += len(piece) + (1 if current else 0)
+        current.append(piece)
+    if current:
+        chunks.append(FENCE + '\n'.join(current) + FENCE)
+    return chunks
+
+
+def render_list(events):
+    return chunk_lines([f'{i+1}. {e["text"]}' for i, e in enumerate(events)])
+
+
+def render_summary(events):
+    return chunk_lines([f'{i+1}. {e["text"]} 🐱🌹' for i, e in enumerate(events)], header='Your upcoming events:')
+
+
+RENDERERS = {"list": render_list, "summary": render_summary}
+
+
+class RenderCache:
+    """Ready-to-send message chunks per user, rebuilt only when their events change.
+
+    Entries are keyed on the storage's version(user_id), so any add, edit,
+    remove or archive makes the next lookup re-render. Runs on storage
+    threads: call it through AsyncStorage.call.
+
+    Each kind ("summary", "list", "view") has its own LRU of `maxsize`
+    entries, so the daily summary burst, which touches every user once,
+    can't evict the lists and pages people are actively using.
+    """
+
+    def __init__(self, storage, maxsize=4096):
+        self.storage = storage
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._caches = {}  # kind -> OrderedDict of key -> (version, chunks or sorted view)
+        self._lock = threading.Lock()
+
+    def _cached(self, kind, key, version, build):
+        with self._lock:
+            cache = self._caches.setdefault(kind, OrderedDict())
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            cache[key] = (version, value)
+            cache.move_to_end(key)
+            while len(cache) > self.maxsize:
+                cache.popitem(last=False)
+        return value
+
+    def chunks(self, user_id, kind):
+        """Message chunks for "list" or "summary"; [] when the user has no events."""
+        # read the version first: a change before the render only makes this entry stale
+        version = self.storage.version(user_id)
+        return self._cached(kind, user_id, version,
+                            lambda: RENDERERS[kind](self.storage.sorted_tasks(user_id)))
+
+    def view(self, user_id, kind, year=None, month=None):
+        """Sorted events ("list") or filtered backlog ("backlog") to page through. Don't mutate it."""
+        version = self.storage.version(user_id)
+        if kind == "list":
+            build = lambda: self.storage.sorted_tasks(user_id)
+        else:
+            # the backlog only changes when an event is removed, which bumps the version too
+            build = lambda: sorted(self.storage.list_backlog(user_id, year, month), key=sort_key)
+        return self._cached("view", (user_id, kind, year, month), version, build)
+
+    def stats(self):
+        with self._lock:
+            cached = sum(len(cache) for cache in self._caches.values())
+        return {"hits": self.hits, "misses": self.misses, "cached": cached}
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class UserResolver:
+    """Resolves user ids to discord User objects for DM delivery.
+
+    Checks the client's own cache (get_user) first, then an LRU cache with a
+    TTL, and only then calls fetch_user. Concurrent lookups of the same id
+    share a single fetch.
+    """
+
+    def __init__(self, client, maxsize=1024, ttl=3600, stats=None):
+        self.client = client
+        self.stats_sink = stats
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (expires_at, user)
+        self._pending = {}  # user_id -> fetch task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def resolve(self, user_id):
+        user_id = int(user_id)
+        now = time.monotonic()
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] > now:
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+        user = self.client.get_user(user_id)
+        if user is not None:
+            self.hits += 1
+            self._store(user_id, user, now)
+            return user
+
+        task = self._pending.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._pending[user_id] = asyncio.ensure_future(self._fetch(user_id))
+            task.add_done_callback(lambda _: self._pending.pop(user_id, None))
+        # shield so one cancelled caller doesn't cancel the fetch for the others
+        user = await asyncio.shield(task)
+        self._store(user_id, user, time.monotonic())
+        return user
+
+    async def _fetch(self, user_id):
+        if self.stats_sink is None:
+            return await self.client.fetch_user(user_id)
+        with self.stats_sink.timer("fetch"):
+            return await self.client.fetch_user(user_id)
+
+    async def dm_channel(self, user_id):
+        user = await self.resolve(user_id)
+        return user.dm_channel or await user.create_dm()
+
+    def invalidate(self, user_id):
+        self._cache.pop(int(user_id), None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "cached": len(self._cache)}
+
+    def _store(self, user_id, user, now):
+        self._cache[user_id] = (now + self.ttl, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
@@ -0,0 +1,142 @@
+import heapq
+import itertools
+from collections import namedtuple
+from datetime import timedelta
+from ledger import TIME_FORMAT
+from utils import next_reminder_time_utc, get_event_utc_datetime
+
+SUMMARY = "summary"
+HOUR_BEFORE = "hour_before"
+ARCHIVE = "archive"
+
+# due is a naive UTC datetime; event is None for daily summaries
+Reminder = namedtuple("Reminder", ["due", "user_id", "kind", "event"])
+
+# how far back build() looks for reminders missed while the bot was down or lagging
+MAX_CATCH_UP = timedelta(hours=6)
+
+
+def reminder_key(reminder):
+    """Identity of one delivery, for the sent ledger."""
+    event_part = "" if reminder.event is None else reminder.event.get("id", reminder.event["text"])
+    return f"{reminder.user_id}|{reminder.kind}|{reminder.due.strftime(TIME_FORMAT)}|{event_part}"
+
+
+class ReminderScheduler:
+    """Min-heap of upcoming reminders, built once from storage.
+
+    Entries are invalidated lazily: rescheduling a user bumps their generation
+    and stale entries are dropped when they reach the top of the heap.
+
+    Due detection is window based: build() schedules everything due after
+    `since` (normally the last completed tick), so reminders that fell due
+    during a restart or a stall are still delivered, and a SentLedger keeps
+    them from being delivered twice.
+    """
+
+    def __init__(self, storage, ledger=None):
+        self.storage = storage
+        self.ledger = ledger
+        self._heap = []
+        self._generation = {}
+        self._live = {}
+        self._stale = 0
+        self._seq = itertools.count()
+        self._popped_through = None  # every reminder due at or before this has been popped
+
+    def build(self, now_utc, users=None, since=None):
+        """Schedule every user. users maps user_id to user data; read from storage if omitted.
+
+        Reminders due after `since` (default now_utc, at most MAX_CATCH_UP ago) are included.
+        """
+        since = now_utc if since is None else max(min(since, now_utc), now_utc - MAX_CATCH_UP)
+        if users is None:
+            users = {user_id: self.storage.get_user(user_id) for user_id in self.storage.list_users()}
+        self._heap = []
+        self._generation = {}
+        self._live = {}
+        self._stale = 0
+        self._popped_through = since
+        for user_id, user_data in users.items():
+            self._schedule_user(user_id, now_utc, user_data, since)
+
+    def reschedule_user(self, user_id, now_utc, user_data=None):
+        """Drop a user's pending reminders and recompute them from their current data.
+
+        Reminders already due but not yet popped are kept: the window starts
+        where pop_due left off, not at now_utc.
+        """
+        if user_data is None:
+            user_data = self.storage.get_user(user_id)
+        since = now_utc if self._popped_through is None else min(self._popped_through, now_utc)
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        self._stale += self._live.pop(user_id, 0)
+        self._schedule_user(user_id, now_utc, user_data, since)
+        if self._stale > 64 and self._stale > len(self._heap) // 2:
+            self._compact()
+
+    def next_due(self):
+        """UTC datetime of the earliest pending reminder, or None."""
+        self._drop_stale_top()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now_utc):
+        """Remove and return every reminder due at or before now_utc that the ledger hasn't seen."""
+        due = []
+        if self._popped_through is None or now_utc > self._popped_through:
+            self._popped_through = now_utc
+        while self._heap and self._heap[0][0] <= now_utc:
+            _, _, generation, reminder = heapq.heappop(self._heap)
+            if not self._is_current(reminder.user_id, generation):
+                self._stale -= 1
+                continue
+            self._live[reminder.user_id] -= 1
+            if reminder.kind == SUMMARY:
+                next_due = reminder.due + timedelta(days=1)
+                while next_due <= now_utc:
+                    next_due += timedelta(days=1)
+                self._push(reminder._replace(due=next_due))
+            if self.ledger is not None and self.ledger.was_sent(reminder_key(reminder)):
+                continue
+            due.append(reminder)
+        return due
+
+    def __len__(self):
+        return len(self._heap) - self._stale
+
+    def _schedule_user(self, user_id, now_utc, user_data, since):
+        tz_offset = user_data.get("timezone", 0)
+        reminder_time = user_data.get("reminder_time", "03:30")
+        self._push(Reminder(next_reminder_time_utc(reminder_time, tz_offset, since), user_id, SUMMARY, None))
+        for event in user_data.get("events", []):
+            try:
+                event_utc = get_event_utc_datetime(event, tz_offset)
+            except ValueError as e:
+                print(f"[ERROR] could not schedule event {event}: {e}")
+                continue
+            if not event_utc:
+                continue
+            remind_at_utc = event_utc - timedelta(hours=1)
+            # a missed "in 1 hour" is still worth sending until the event starts
+            if remind_at_utc > since and event_utc > now_utc:
+                self._push(Reminder(remind_at_utc, user_id, HOUR_BEFORE, event))
+            # past events are archived on the next pop
+            self._push(Reminder(event_utc, user_id, ARCHIVE, event))
+
+    def _push(self, reminder):
+        generation = self._generation.get(reminder.user_id, 0)
+        heapq.heappush(self._heap, (reminder.due, next(self._seq), generation, reminder))
+        self._live[reminder.user_id] = self._live.get(reminder.user_id, 0) + 1
+
+    def _is_current(self, user_id, generation):
+        return generation == self._generation.get(user_id, 0)
+
+    def _drop_stale_top(self):
+        while self._heap and not self._is_current(self._heap[0][3].user_id, self._heap[0][2]):
+            heapq.heappop(self._heap)
+            self._stale -= 1
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._is_current(entry[3].user_id, entry[2])]
+        heapq.heapify(self._heap)
+        self._stale = 0
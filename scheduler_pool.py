@@ -0,0 +1,108 @@
+import copy
+import multiprocessing
+import queue
+import zlib
+from datetime import datetime
+from scheduler import ReminderScheduler, reminder_key
+
+BUILD = "build"
+RESCHEDULE = "reschedule"
+STOP = "stop"
+
+# workers report at least this often so the pool's watermark keeps moving
+MAX_SLEEP = 60
+
+
+def partition_of(user_id, partitions):
+    """Stable partition for a user id (hash() is salted per process, crc32 isn't)."""
+    return zlib.crc32(str(user_id).encode()) % partitions
+
+
+def run_worker(inbox, outbox, partition):
+    """Worker loop: own one partition's schedule and report (partition, now, due reminders)."""
+    scheduler = ReminderScheduler(storage=None)
+    while True:
+        next_due = scheduler.next_due()
+        timeout = MAX_SLEEP
+        if next_due is not None:
+            timeout = min(max((next_due - datetime.utcnow()).total_seconds(), 0), MAX_SLEEP)
+        try:
+            message = inbox.get(timeout=timeout)
+        except queue.Empty:
+            message = None
+        if message is not None:
+            if message[0] == STOP:
+                return
+            if message[0] == BUILD:
+                scheduler.build(*message[1:])
+            elif message[0] == RESCHEDULE:
+                scheduler.reschedule_user(*message[1:])
+        now_utc = datetime.utcnow()
+        outbox.put((partition, now_utc, scheduler.pop_due(now_utc)))
+
+
+class SchedulerPool:
+    """ReminderScheduler split across worker processes by a hash of user id.
+
+    Each worker owns the heap for its users and pushes due Reminder records
+    back over a single queue, so evaluating reminders doesn't compete with
+    the gateway for the GIL. User data is sent to the owning worker on
+    build() and reschedule_user(); workers never touch storage. Both copy
+    it before returning, because a Queue pickles on its feeder thread later,
+    by which time storage may have changed the caller's dicts.
+
+    Workers are forked, so start() must run before the process starts any
+    threads (bot.py starts the pool at import time).
+    """
+
+    def __init__(self, workers, ledger=None):
+        ctx = multiprocessing.get_context("fork")
+        self.workers = workers
+        self.ledger = ledger
+        self._outbox = ctx.Queue()
+        self._inboxes = [ctx.Queue() for _ in range(workers)]
+        self._processes = [ctx.Process(target=run_worker, args=(inbox, self._outbox, i), daemon=True)
+                           for i, inbox in enumerate(self._inboxes)]
+        self._reported = [None] * workers
+
+    def start(self):
+        for process in self._processes:
+            if process.pid is None:
+                process.start()
+
+    def build(self, now_utc, users, since=None):
+        parts = [{} for _ in range(self.workers)]
+        for user_id, user_data in users.items():
+            parts[partition_of(user_id, self.workers)][user_id] = user_data
+        for inbox, part in zip(self._inboxes, parts):
+            inbox.put((BUILD, now_utc, copy.deepcopy(part), since))
+
+    def reschedule_user(self, user_id, now_utc, user_data):
+        self._inboxes[partition_of(user_id, self.workers)].put(
+            (RESCHEDULE, user_id, now_utc, copy.deepcopy(user_data)))
+
+    def watermark(self):
+        """Latest instant every worker has evaluated up to, or None before all have reported."""
+        if any(reported is None for reported in self._reported):
+            return None
+        return min(self._reported)
+
+    def receive(self, timeout=1):
+        """Wait for the next worker report. Returns reminders the ledger hasn't seen ([] on timeout)."""
+        try:
+            partition, now_utc, due = self._outbox.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        self._reported[partition] = now_utc
+        if self.ledger is not None:
+            due = [r for r in due if not self.ledger.was_sent(reminder_key(r))]
+        return due
+
+    def close(self):
+        for inbox in self._inboxes:
+            inbox.put((STOP,))
+        for process in self._processes:
+            if process.pid is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
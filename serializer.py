@@ -0,0 +1,171 @@
+import json
+import struct
+from collections.abc import MutableMapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SNAPSHOT_MAGIC = b"TBSNAP1\n"
+# length of the offset table that follows the magic
+_TABLE_LEN = struct.Struct("<I")
+
+
+class JsonCodec:
+    """Encode/decode one value with the stdlib json module; compact unless indent is given."""
+
+    def __init__(self, indent=None):
+        self.indent = indent
+
+    def dumps(self, obj):
+        if self.indent is None:
+            return json.dumps(obj, separators=(',', ':')).encode()
+        return json.dumps(obj, indent=self.indent).encode()
+
+    def loads(self, raw):
+        return json.loads(raw)
+
+
+class OrjsonCodec:
+    """Same output as a compact JsonCodec, several times faster."""
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, raw):
+        return orjson.loads(raw)
+
+
+def fast_codec():
+    return OrjsonCodec() if orjson is not None else JsonCodec()
+
+
+class LazyUsers(MutableMapping):
+    """User records from a snapshot, decoded on first access.
+
+    Users nobody touched keep their encoded bytes and are written back as-is.
+    """
+
+    def __init__(self, records, codec):
+        self._raw = records  # user_id -> encoded bytes
+        self._decoded = {}
+        self._codec = codec
+
+    def __getitem__(self, user_id):
+        if user_id not in self._decoded:
+            self._decoded[user_id] = self._codec.loads(self._raw[user_id])
+        return self._decoded[user_id]
+
+    def __setitem__(self, user_id, value):
+        self._decoded[user_id] = value
+
+    def __delitem__(self, user_id):
+        if user_id not in self._raw and user_id not in self._decoded:
+            raise KeyError(user_id)
+        self._raw.pop(user_id, None)
+        self._decoded.pop(user_id, None)
+
+    def __iter__(self):
+        yield from self._raw
+        yield from (user_id for user_id in self._decoded if user_id not in self._raw)
+
+    def __len__(self):
+        return len(self._raw) + sum(1 for user_id in self._decoded if user_id not in self._raw)
+
+    def with_field(self, name):
+        """User ids whose record may have a top-level `name` key, without decoding the others.
+
+        Undecoded records are searched for the encoded key, so an event
+        text that contains it only costs a needless decode.
+        """
+        needle = self._codec.dumps(name)
+        return [user_id for user_id in self
+                if (name in self._decoded[user_id] if user_id in self._decoded else needle in self._raw[user_id])]
+
+    def encoded(self, codec):
+        """{user_id: bytes}, re-encoding only the users that were decoded."""
+        return {user_id: codec.dumps(self._decoded[user_id]) if user_id in self._decoded else self._raw[user_id]
+                for user_id in self}
+
+
+class JsonSerializer:
+    """The whole document as one JSON object (the original storage.json format)."""
+
+    def __init__(self, codec):
+        self.codec = codec
+
+    def dump(self, data):
+        return self.codec.dumps(data if isinstance(data, dict) else dict(data))
+
+
+class SnapshotSerializer:
+    """Binary snapshot: magic, offset table, then one JSON record per user.
+
+    The table maps user_id -> [offset, length] relative to the end of the
+    table, so one user can be read without decoding anyone else.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+
+    def dump(self, data):
+        if isinstance(data, LazyUsers):
+            records = data.encoded(self.codec)
+        else:
+            records = {user_id: self.codec.dumps(user_data) for user_id, user_data in data.items()}
+        table = {}
+        offset = 0
+        for user_id, record in records.items():
+            table[user_id] = [offset, len(record)]
+            offset += len(record)
+        table_raw = self.codec.dumps(table)
+        return b"".join([SNAPSHOT_MAGIC, _TABLE_LEN.pack(len(table_raw)), table_raw, *records.values()])
+
+
+SERIALIZERS = {
+    'json-pretty': lambda: JsonSerializer(JsonCodec(indent=2)),
+    'json': lambda: JsonSerializer(fast_codec()),
+    'snapshot': lambda: SnapshotSerializer(fast_codec()),
+}
+
+
+def get_serializer(name='json-pretty'):
+    """Serializer for a STORAGE_FORMAT name: 'json-pretty', 'json' or 'snapshot'."""
+    return SERIALIZERS[name]()
+
+
+def _read_table(raw):
+    header = len(SNAPSHOT_MAGIC) + _TABLE_LEN.size
+    if len(raw) < header:
+        raise ValueError("truncated snapshot header")
+    (table_len,) = _TABLE_LEN.unpack_from(raw, len(SNAPSHOT_MAGIC))
+    return fast_codec().loads(raw[header:header + table_len]), header + table_len
+
+
+def load_document(raw):
+    """Decode a storage file in any supported format; snapshots come back as LazyUsers."""
+    codec = fast_codec()
+    if not raw.startswith(SNAPSHOT_MAGIC):
+        return codec.loads(raw)
+    table, start = _read_table(raw)
+    # records decode lazily, so catch a torn write here rather than on first access
+    if any(start + offset + length > len(raw) for offset, length in table.values()):
+        raise ValueError("truncated snapshot")
+    records = {user_id: raw[start + offset:start + offset + length] for user_id, (offset, length) in table.items()}
+    return LazyUsers(records, codec)
+
+
+def read_user(path, user_id):
+    """One user's record straight from a snapshot file, or None if absent."""
+    with open(path, 'rb') as f:
+        head = f.read(len(SNAPSHOT_MAGIC) + _TABLE_LEN.size)
+        if not head.startswith(SNAPSHOT_MAGIC):
+            raise ValueError(f"{path} is not a snapshot")
+        (table_len,) = _TABLE_LEN.unpack_from(head, len(SNAPSHOT_MAGIC))
+        table = fast_codec().loads(f.read(table_len))
+        if user_id not in table:
+            return None
+        offset, length = table[user_id]
+        f.seek(len(head) + table_len + offset)
+        return fast_codec().loads(f.read(length))
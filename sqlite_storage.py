@@ -0,0 +1,447 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from utils import event_record, event_key, ensure_event_fields, local_to_utc, matches_date_filter
+from event_index import EventIndex
+from storage import StorageBatch
+from serializer import load_document
+from archive import ColdArchive
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    timezone REAL,
+    reminder_time TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    date TEXT,
+    local TEXT,
+    has_time INTEGER NOT NULL DEFAULT 0,
+    due_utc TEXT
+);
+CREATE INDEX IF NOT EXISTS events_user_date ON events (user_id, date);
+CREATE INDEX IF NOT EXISTS events_user_text_date ON events (user_id, text, date);
+CREATE INDEX IF NOT EXISTS events_due_utc ON events (due_utc);
+CREATE TABLE IF NOT EXISTS backlog (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    date TEXT,
+    local TEXT,
+    has_time INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS backlog_user_date ON backlog (user_id, date);
+CREATE INDEX IF NOT EXISTS backlog_user_text_date ON backlog (user_id, text, date);
+CREATE TABLE IF NOT EXISTS birthdays (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    month_day TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS birthdays_month_day ON birthdays (month_day);
+CREATE INDEX IF NOT EXISTS birthdays_user_month_day ON birthdays (user_id, month_day);
+'''
+
+DUE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class SqliteStorage:
+    """Drop-in replacement for Storage backed by sqlite3 in WAL mode.
+
+    Events keep their insertion order (by rowid), so list indices mean the
+    same thing as in the JSON backend, and the rowid doubles as the stable
+    event id. Timed events also store their UTC instant in due_utc so range
+    queries can use an index.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._indexes = {}
+        self._in_batch = False
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+
+    def pending_commit(self):
+        """Always None: every mutation has committed its transaction before returning."""
+        return None
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Commit on success, roll back on error; inside apply_batch the batch owns the transaction."""
+        with self._lock:
+            if self._in_batch:
+                yield
+                return
+            with self._conn:
+                yield
+
+    @contextmanager
+    def batch(self):
+        """Queue mutations and apply them in one transaction. Nothing is applied if the block raises."""
+        batch = StorageBatch()
+        yield batch
+        self.apply_batch(batch)
+
+    def apply_batch(self, batch):
+        """Apply a StorageBatch in a single transaction, rolling everything back if an operation raises."""
+        with self._lock:
+            batch.check(self)
+            self._in_batch = True
+            try:
+                with self._conn:
+                    batch.results = [getattr(self, name)(user_id, *args) for name, user_id, args in batch.ops]
+            except Exception:
+                # in-memory indexes may have seen part of the batch
+                for _, user_id, _ in batch.ops:
+                    self._indexes.pop(user_id, None)
+                raise
+            finally:
+                self._in_batch = False
+            return batch.results
+
+    def _ensure_user(self, user_id):
+        self._conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+
+    def _timezone(self, user_id):
+        row = self._conn.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    def _due_utc(self, record, tz_offset):
+        if not record["has_time"]:
+            return None
+        return local_to_utc(datetime.strptime(record["local"], DUE_FORMAT), tz_offset).strftime(DUE_FORMAT)
+
+    def _record(self, event_id, text, date_str, local, has_time):
+        return {"text": text, "date": date_str, "local": local, "has_time": bool(has_time), "id": event_id}
+
+    def _user_index(self, user_id):
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._indexes[user_id] = EventIndex(self._list("events", user_id))
+        return index
+
+    def _event_id(self, table, user_id, index):
+        if index < 0:
+            return None
+        row = self._conn.execute(
+            f"SELECT id FROM {table} WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?", (user_id, index)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _event_exists(self, table, user_id, text, date_str):
+        """Same duplicate rule as the JSON backend: event_key, i.e. whitespace-normalised text and date."""
+        key = event_key(text, date_str)
+        rows = self._conn.execute(f"SELECT text FROM {table} WHERE user_id = ? AND date IS ?", (user_id, date_str))
+        return any(event_key(row[0], date_str) == key for row in rows)
+
+    def _list(self, table, user_id):
+        rows = self._conn.execute(
+            f"SELECT id, text, date, local, has_time FROM {table} WHERE user_id = ? ORDER BY id", (user_id,)
+        )
+        return [self._record(*row) for row in rows]
+
+    def _insert_event(self, user_id, text, date_str, tz_offset):
+        record = event_record(text, date_str)
+        cursor = self._conn.execute(
+            "INSERT INTO events (user_id, text, date, local, has_time, due_utc) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, text, date_str, record["local"], record["has_time"], self._due_utc(record, tz_offset)),
+        )
+        record["id"] = cursor.lastrowid
+        return record
+
+    def _insert_backlog(self, user_id, text, date_str, local, has_time):
+        # Add to backlog if not duplicate
+        if not self._event_exists("backlog", user_id, text, date_str):
+            self._conn.execute(
+                "INSERT INTO backlog (user_id, text, date, local, has_time) VALUES (?, ?, ?, ?, ?)",
+                (user_id, text, date_str, local, has_time),
+            )
+
+    def _move_to_backlog(self, user_id, event_id):
+        row = self._conn.execute(
+            "SELECT text, date, local, has_time FROM events WHERE id = ? AND user_id = ?", (event_id, user_id)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+        self._insert_backlog(user_id, *row)
+        return self._user_index(user_id).remove(event_id) or self._record(event_id, *row)
+
+    def add_task(self, user_id, text, date):
+        """Add an event and return its 1-based display position, or False if it already exists."""
+        text = text.strip()
+        date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
+        with self._transaction():
+            index = self._user_index(user_id)
+            if index.find(text, date_str):
+                return False  # Duplicate
+            self._ensure_user(user_id)
+            return index.add(self._insert_event(user_id, text, date_str, self._timezone(user_id)))
+
+    def add_tasks(self, user_id, items):
+        """Add many (text, date) events in one transaction. Returns (added, skipped)."""
+        with self._transaction():
+            self._ensure_user(user_id)
+            tz_offset = self._timezone(user_id)
+            index = self._user_index(user_id)
+            added = skipped = 0
+            for text, date in items:
+                text = text.strip()
+                date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
+                if not text or index.find(text, date_str):
+                    skipped += 1
+                    continue
+                index.add(self._insert_event(user_id, text, date_str, tz_offset))
+                added += 1
+            return added, skipped
+
+    def list_tasks(self, user_id):
+        with self._lock:
+            return self._list("events", user_id)
+
+    def remove_task(self, user_id, index):
+        with self._transaction():
+            event_id = self._event_id("events", user_id, index)
+            if event_id is None:
+                return False
+            self._move_to_backlog(user_id, event_id)
+            return True
+
+    def sorted_tasks(self, user_id):
+        """Events in display order."""
+        with self._lock:
+            return list(self._user_index(user_id))
+
+    def version(self, user_id):
+        """Changes whenever the user's events change; see EventIndex.version."""
+        with self._lock:
+            return self._user_index(user_id).version
+
+    def task_at(self, user_id, position):
+        """Event shown at a 1-based display position, or None."""
+        with self._lock:
+            return self._user_index(user_id).at(position)
+
+    def remove_event(self, user_id, event_id):
+        """Move the event with this id to the backlog. Returns the removed event or None."""
+        with self._transaction():
+            return self._move_to_backlog(user_id, event_id)
+
+    def list_users(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM users")]
+
+    def get_user(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT timezone, reminder_time FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if not row:
+                return {}
+            user_data = {"events": self._list("events", user_id), "backlog": self._list("backlog", user_id)}
+            if row[0] is not None:
+                user_data["timezone"] = row[0]
+            if row[1] is not None:
+                user_data["reminder_time"] = row[1]
+            return user_data
+
+    def list_backlog(self, user_id, year=None, month=None):
+        """Backlog events, optionally only those in a year and/or month."""
+        with self._lock:
+            if not year:
+                events = self._list("backlog", user_id)
+                return [e for e in events if matches_date_filter(e.get("date"), year, month)] if month else events
+            # a year (and month) is a date range, served by the (user_id, date) index
+            start, end = (f"{year}-{month:02d}", f"{year}-{month:02d}~") if month else (f"{year}", f"{year}~")
+            rows = self._conn.execute(
+                "SELECT id, text, date, local, has_time FROM backlog WHERE user_id = ? AND date >= ? AND date < ? ORDER BY id",
+                (user_id, start, end),
+            )
+            return [self._record(*row) for row in rows]
+
+    def archive_event(self, user_id, event):
+        """Move a specific event to backlog by matching its text and date."""
+        with self._transaction():
+            found = self._user_index(user_id).find(event["text"], event.get("date"))
+            if found is None:
+                return False
+            self._move_to_backlog(user_id, found["id"])
+            return True
+
+    def _update_event(self, user_id, event_id, text, date):
+        date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
+        record = event_record(text, date_str)
+        cursor = self._conn.execute(
+            "UPDATE events SET text = ?, date = ?, local = ?, has_time = ?, due_utc = ? WHERE id = ? AND user_id = ?",
+            (text, date_str, record["local"], record["has_time"],
+             self._due_utc(record, self._timezone(user_id)), event_id, user_id),
+        )
+        if cursor.rowcount == 0:
+            return None
+        record["id"] = event_id
+        index = self._user_index(user_id)
+        index.remove(event_id)
+        return index.add(record)
+
+    def edit_task(self, user_id, index, text, date):
+        with self._transaction():
+            event_id = self._event_id("events", user_id, index)
+            if event_id is None:
+                return False
+            self._update_event(user_id, event_id, text, date)
+            return True
+
+    def edit_event(self, user_id, event_id, text, date):
+        """Replace the event with this id, keeping the id. Returns its new display position or None."""
+        with self._transaction():
+            return self._update_event(user_id, event_id, text, date)
+
+    def set_reminder_time(self, user_id, reminder_time):
+        with self._transaction():
+            self._ensure_user(user_id)
+            self._conn.execute("UPDATE users SET reminder_time = ? WHERE user_id = ?", (reminder_time, user_id))
+            return True
+
+    def set_timezone(self, user_id, offset):
+        with self._transaction():
+            self._ensure_user(user_id)
+            self._conn.execute("UPDATE users SET timezone = ? WHERE user_id = ?", (offset, user_id))
+            # due_utc depends on the offset
+            rows = self._conn.execute(
+                "SELECT id, local, has_time FROM events WHERE user_id = ? AND has_time", (user_id,)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE events SET due_utc = ? WHERE id = ?",
+                [(self._due_utc({"local": local, "has_time": has_time}, offset), event_id)
+                 for event_id, local, has_time in rows],
+            )
+            return True
+
+    def events_due_between(self, start_utc, end_utc):
+        """Return (user_id, event, due_utc) for timed events with start_utc <= due_utc < end_utc."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, id, text, date, local, has_time, due_utc FROM events"
+                " WHERE due_utc >= ? AND due_utc < ? ORDER BY due_utc",
+                (start_utc.strftime(DUE_FORMAT), end_utc.strftime(DUE_FORMAT)),
+            ).fetchall()
+        return [(row[0], self._record(*row[1:6]), datetime.strptime(row[6], DUE_FORMAT)) for row in rows]
+
+    def add_birthday(self, user_id, date_key, name):
+        """Add a birthday owned by user_id. date_key is 'MM-DD', name is a string."""
+        with self._transaction():
+            exists = self._conn.execute(
+                "SELECT 1 FROM birthdays WHERE month_day = ? AND name = ? COLLATE NOCASE"
+                " AND (user_id IS NULL OR user_id = ?)", (date_key, name, user_id)
+            ).fetchone()
+            if exists:
+                return False
+            self._conn.execute(
+                "INSERT INTO birthdays (user_id, month_day, name) VALUES (?, ?, ?)", (user_id, date_key, name)
+            )
+            return True
+
+    def remove_birthday(self, user_id, date_key, name):
+        """Remove a birthday by name from a date, preferring the user's own entry over a shared one."""
+        with self._transaction():
+            cursor = self._conn.execute(
+                "DELETE FROM birthdays WHERE id = (SELECT id FROM birthdays WHERE month_day = ? AND name = ? COLLATE NOCASE"
+                " AND (user_id IS NULL OR user_id = ?) ORDER BY user_id IS NULL LIMIT 1)",
+                (date_key, name, user_id),
+            )
+            return cursor.rowcount > 0
+
+    def birthdays_on(self, user_id, date_key):
+        """Names with a birthday on 'MM-DD' visible to user_id."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM birthdays WHERE month_day = ? AND (user_id IS NULL OR user_id = ?) ORDER BY id",
+                (date_key, user_id),
+            )
+            return [row[0] for row in rows]
+
+    def list_birthdays(self, user_id):
+        """Return birthdays dict: {'MM-DD': ['name1', 'name2'], ...}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT month_day, name FROM birthdays WHERE user_id IS NULL OR user_id = ? ORDER BY id", (user_id,)
+            )
+            result = {}
+            for date_key, name in rows:
+                result.setdefault(date_key, []).append(name)
+            return result
+
+    def migrate_from_json(self, json_path, birthdays_path='birthdays.json', archive_dir='archive'):
+        """One-shot import of storage.json, birthdays.json and the cold archive in a single transaction."""
+        try:
+            with open(json_path, 'rb') as f:
+                data = load_document(f.read())
+        except FileNotFoundError:
+            data = {}
+        try:
+            with open(birthdays_path, 'r') as f:
+                birthdays = json.load(f)
+        except FileNotFoundError:
+            birthdays = {}
+
+        with self._transaction():
+            if self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                raise RuntimeError(f"{self.filename} already has data, refusing to migrate")
+            for user_id, user_data in data.items():
+                tz_offset = user_data.get("timezone", 0)
+                self._conn.execute(
+                    "INSERT INTO users (user_id, timezone, reminder_time) VALUES (?, ?, ?)",
+                    (user_id, user_data.get("timezone"), user_data.get("reminder_time")),
+                )
+                for e in user_data.get("events", []):
+                    if not self._event_exists("events", user_id, e["text"], e.get("date")):
+                        self._insert_event(user_id, e["text"], e.get("date"), tz_offset)
+                for e in user_data.get("backlog", []):
+                    record = event_record(e["text"], e.get("date"))
+                    self._insert_backlog(user_id, e["text"], e.get("date"), record["local"], record["has_time"])
+            if os.path.isdir(archive_dir):
+                # the JSON backend keeps removed events here; either compression setting may have written them
+                for archive in (ColdArchive(archive_dir, compress=True), ColdArchive(archive_dir, compress=False)):
+                    for user_id in archive.users():
+                        self._ensure_user(user_id)
+                        for e in map(ensure_event_fields, archive.query(user_id)):
+                            self._insert_backlog(user_id, e["text"], e.get("date"), e["local"], e["has_time"])
+            # top-level entries are shared (owner NULL); "by_user" holds each user's own
+            owned = [(None, birthdays)] + list(birthdays.get("by_user", {}).items())
+            for owner, dates in owned:
+                for date_key, names_str in dates.items():
+                    if date_key == "by_user":
+                        continue
+                    for name in [n.strip() for n in names_str.split("/") if n.strip()]:
+                        self._conn.execute(
+                            "INSERT INTO birthdays (user_id, month_day, name) VALUES (?, ?, ?)", (owner, date_key, name)
+                        )
+        return len(data)
+
+
+if __name__ == '__main__':
+    # usage: python3 sqlite_storage.py [storage.json] [birthdays.json] [storage.db] [archive]
+    args = sys.argv[1:] + ['storage.json', 'birthdays.json', 'storage.db', 'archive'][len(sys.argv[1:]):]
+    db = SqliteStorage(args[2])
+    count = db.migrate_from_json(args[0], args[1], args[3])
+    db.close()
+    print(f"migrated {count} users into {args[2]}")
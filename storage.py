@@ -1,158 +1,509 @@
+import copy
 import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import re
+from utils import event_record, event_key, matches_date_filter
+from event_index import EventIndex
+from serializer import get_serializer, load_document, LazyUsers
+from durable import GroupCommit, atomic_write, load_with_backups
+
+class VersionConflict(Exception):
+    """A batch expected a user's events at a version they have since moved past."""
+
+
+class StorageBatch:
+    """Mutations queued by Storage.batch() and applied together when it exits.
+
+    After a successful commit, results holds each operation's return value
+    in the order the operations were queued. expect_version() makes the
+    batch compare-and-swap: it raises VersionConflict instead of applying
+    if any expected user's version(user_id) has changed.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self.expected = {}
+        self.results = None
+
+    def __len__(self):
+        return len(self.ops)
+
+    def add_task(self, user_id, text, date):
+        self.ops.append(("add_task", user_id, (text, date)))
+
+    def remove_event(self, user_id, event_id):
+        self.ops.append(("remove_event", user_id, (event_id,)))
+
+    def edit_event(self, user_id, event_id, text, date):
+        self.ops.append(("edit_event", user_id, (event_id, text, date)))
+
+    def archive_event(self, user_id, event):
+        self.ops.append(("archive_event", user_id, (event,)))
+
+    def expect_version(self, user_id, version):
+        self.expected[user_id] = version
+
+    def check(self, storage):
+        """Raise VersionConflict unless every expected version is current; call under the storage lock."""
+        for user_id, version in self.expected.items():
+            if storage.version(user_id) != version:
+                raise VersionConflict(user_id)
+
 
 class Storage:
-    def __init__(self, filename):
+    """JSON-file storage that keeps the parsed state resident in memory.
+
+    Reads are served from memory. Mutations mark the user dirty and the whole
+    document is flushed to disk (write to temp, fsync, then rename) at most
+    once per flush_interval seconds; flush_interval=0 writes through
+    immediately. With commit_window, mutations arriving within that many
+    seconds of each other share one flush instead, and pending_commit()
+    returns the Future for the flush that will cover them. Call close() on
+    shutdown to flush anything still pending.
+
+    The previous `backups` versions of the file are kept as filename.1,
+    filename.2, ... and are loaded instead if the file itself won't parse.
+
+    Each event has a per-user stable "id", and each user's events are also
+    kept in an EventIndex so display positions resolve without re-sorting.
+
+    The on-disk format comes from the serializer (see serializer.py); any
+    supported format is read back regardless of which one writes.
+
+    With a ColdArchive, removed events go to the archive's month partitions
+    on the next flush instead of the "backlog" list in the JSON file.
+    """
+
+    def __init__(self, filename, flush_interval=0, birthdays_filename='birthdays.json', archive=None,
+                 serializer=None, commit_window=0, backups=3):
         self.filename = filename
+        self.backups = backups
+        self.serializer = serializer or get_serializer()
+        self.archive = archive
+        self._cold_pending = []  # (user_id, event) moved to backlog but not yet archived
+        self._cold_parked = set()  # users whose in-file backlog holds events the archive refused
+        self.birthdays_filename = birthdays_filename
+        self._birthdays = None
+        self.flush_interval = flush_interval
+        self._committer = GroupCommit(self.flush, commit_window) if commit_window > 0 else None
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._flush_timer = None
+        self._batch_depth = 0
+        self._indexes = {}
+        self._backlog_keys = {}  # user_id -> set of event_key for the in-file backlog
         if not os.path.exists(filename):
             with open(filename, 'w') as f:
                 json.dump({}, f)
+        self._data = self._load()
+        if archive is not None:
+            self._migrate_backlog()
+
+    def _load(self):
+        return load_with_backups(self.filename, load_document, self.backups)
 
     def _read(self):
-        try:
-            with open(self.filename, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            with open(self.filename, 'w') as f:
-                json.dump({}, f)
-            return {}
+        return self._data
+
+    def _migrate_backlog(self):
+        """Move any backlog still in the JSON file into the cold archive."""
+        moved = False
+        # a snapshot stays lazy: only records that mention "backlog" are decoded
+        users = self._data.with_field("backlog") if isinstance(self._data, LazyUsers) else list(self._data)
+        for user_id in users:
+            user_data = self._data[user_id]
+            if user_data.get("backlog"):
+                self.archive.append(user_id, user_data["backlog"])
+                moved = True
+            user_data.pop("backlog", None)
+        if moved:
+            self._write(self._data)
+
+    def _mark_dirty(self, user_id):
+        self._dirty.add(user_id)
+        if not self._batch_depth:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._committer is not None:
+            self._committer.request()
+        elif self.flush_interval <= 0:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Write the resident state to disk if any user is dirty."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+            # archive first: a crash in between leaves a duplicate, never a lost event
+            self._flush_cold()
+            self._write(self._data)
+            self._dirty.clear()
+
+    def _flush_cold(self):
+        """Archive pending backlog; events the archive can't take are kept in the file's "backlog" instead.
+
+        A failing partition must not stop storage.json being written for
+        everyone else. Parked events are retried on every flush, and moved
+        by _migrate_backlog after a restart.
+        """
+        data = self._read()
+        by_user = {}
+        for user_id in self._cold_parked:
+            by_user[user_id] = data[user_id].pop("backlog", [])
+        self._cold_parked = set()
+        for user_id, event in self._cold_pending:
+            by_user.setdefault(user_id, []).append(event)
+        self._cold_pending = []
+        for user_id, events in by_user.items():
+            try:
+                self.archive.append(user_id, events)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] archiving {len(events)} backlog events for {user_id} failed, "
+                      f"keeping them in {self.filename}: {e}")
+                data[user_id].setdefault("backlog", []).extend(events)
+                self._cold_parked.add(user_id)
+
+    def pending_commit(self):
+        """Future for the group commit covering every mutation so far, or None if they're already written."""
+        if self._committer is None:
+            return None
+        with self._lock:
+            return self._committer.request() if self._dirty else None
+
+    def close(self):
+        if self._committer is not None:
+            self._committer.close()
+        self.flush()
+
+    @contextmanager
+    def batch(self):
+        """Queue mutations and apply them all-or-nothing with a single flush.
+
+            with storage.batch() as batch:
+                batch.remove_event(user_id, event_id)
+
+        Nothing is applied if the block raises.
+        """
+        batch = StorageBatch()
+        yield batch
+        self.apply_batch(batch)
+
+    def apply_batch(self, batch):
+        """Apply a StorageBatch; if any operation raises, every touched user is restored."""
+        with self._lock:
+            batch.check(self)
+            data = self._read()
+            backup = {user_id: copy.deepcopy(data.get(user_id)) for _, user_id, _ in batch.ops}
+            pending = len(self._cold_pending)
+            self._batch_depth += 1
+            try:
+                batch.results = [getattr(self, name)(user_id, *args) for name, user_id, args in batch.ops]
+            except Exception:
+                for user_id, user_data in backup.items():
+                    if user_data is None:
+                        data.pop(user_id, None)
+                    else:
+                        data[user_id] = user_data
+                    self._indexes.pop(user_id, None)
+                    self._backlog_keys.pop(user_id, None)
+                del self._cold_pending[pending:]
+                raise
+            finally:
+                self._batch_depth -= 1
+            if self._dirty and not self._batch_depth:
+                self._schedule_flush()
+            return batch.results
 
     def _write(self, data):
-        with open(self.filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        atomic_write(self.filename, self.serializer.dump(data), self.backups)
 
-    def _event_exists(self, events, text, date_str):
-        """Check if an event with same text and date already exists."""
-        for e in events:
-            if e["text"] == text and e.get("date") == date_str:
-                return True
-        return False
+    def _next_id(self, user_data):
+        event_id = user_data.get("next_id", 1)
+        user_data["next_id"] = event_id + 1
+        return event_id
+
+    def _user_index(self, user_id):
+        """Build (once) the display-order index for a user, assigning missing ids."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            user_data = self._read().get(user_id, {})
+            events = user_data.get("events", [])
+            if any("id" not in e for e in events):
+                for e in events:
+                    if "id" not in e:
+                        e["id"] = self._next_id(user_data)
+                self._mark_dirty(user_id)
+            index = self._indexes[user_id] = EventIndex(events)
+        return index
+
+    def _backlog_key_set(self, user_id):
+        """event_keys of the user's in-file backlog, built on first use."""
+        keys = self._backlog_keys.get(user_id)
+        if keys is None:
+            backlog = self._read()[user_id].get("backlog", [])
+            keys = self._backlog_keys[user_id] = {event_key(e["text"], e.get("date")) for e in backlog}
+        return keys
 
     def add_task(self, user_id, text, date):
-        data = self._read()
-        data.setdefault(user_id, {"events": []})
+        """Add an event and return its 1-based display position, or False if it already exists."""
+        with self._lock:
+            data = self._read()
+            data.setdefault(user_id, {"events": []})
 
-        text = text.strip()
-        date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
+            text = text.strip()
+            date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
 
-        if self._event_exists(data[user_id]["events"], text, date_str):
-            return False  # Duplicate
+            index = self._user_index(user_id)
+            if index.find(text, date_str):
+                return False  # Duplicate
 
-        data[user_id]["events"].append({"text": text, "date": date_str})
-        self._write(data)
-        return True
+            event = event_record(text, date_str)
+            event["id"] = self._next_id(data[user_id])
+            data[user_id]["events"].append(event)
+            self._mark_dirty(user_id)
+            return index.add(event)
+
+    def add_tasks(self, user_id, items):
+        """Add many (text, date) events with one duplicate pass and one write. Returns (added, skipped)."""
+        with self._lock:
+            data = self._read()
+            data.setdefault(user_id, {"events": []})
+            index = self._user_index(user_id)
+            # build every record first, so an item that raises leaves the user untouched
+            records = []
+            keys = set()
+            skipped = 0
+            for text, date in items:
+                text = text.strip()
+                date_str = date.strftime("%Y-%m-%d") if date != datetime.max else None
+                if not text or index.find(text, date_str) or event_key(text, date_str) in keys:
+                    skipped += 1
+                    continue
+                keys.add(event_key(text, date_str))
+                records.append(event_record(text, date_str))
+            for event in records:
+                event["id"] = self._next_id(data[user_id])
+                data[user_id]["events"].append(event)
+                index.add(event)
+            if records:
+                self._mark_dirty(user_id)
+            return len(records), skipped
 
     def list_tasks(self, user_id):
-        return self._read().get(user_id, {}).get("events", [])
+        # copy so callers can't mutate the resident state
+        with self._lock:
+            return list(self._read().get(user_id, {}).get("events", []))
 
-    def remove_task(self, user_id, index):
+    def sorted_tasks(self, user_id):
+        """Events in display order."""
+        with self._lock:
+            return list(self._user_index(user_id))
+
+    def version(self, user_id):
+        """Changes whenever the user's events change; see EventIndex.version."""
+        with self._lock:
+            return self._user_index(user_id).version
+
+    def task_at(self, user_id, position):
+        """Event shown at a 1-based display position, or None."""
+        with self._lock:
+            return self._user_index(user_id).at(position)
+
+    def _move_to_backlog(self, user_id, storage_index):
         data = self._read()
-        events = data.get(user_id, {}).get("events", [])
-        if 0 <= index < len(events):
-            removed = events.pop(index)
-            # Add to backlog if not duplicate
-            data[user_id].setdefault("backlog", [])
-            if not self._event_exists(data[user_id]["backlog"], removed["text"], removed.get("date")):
-                data[user_id]["backlog"].append(removed)
-            self._write(data)
-            return True
-        return False
+        removed = data[user_id]["events"].pop(storage_index)
+        self._user_index(user_id).remove(removed["id"])
+        if self.archive is not None:
+            # the archive skips duplicates when the pending list is flushed
+            self._cold_pending.append((user_id, removed))
+            self._mark_dirty(user_id)
+            return removed
+        # Add to backlog if not duplicate
+        keys = self._backlog_key_set(user_id)
+        key = event_key(removed["text"], removed.get("date"))
+        if key not in keys:
+            keys.add(key)
+            data[user_id].setdefault("backlog", []).append(removed)
+        self._mark_dirty(user_id)
+        return removed
 
-    def list_backlog(self, user_id):
-        return self._read().get(user_id, {}).get("backlog", [])
+    def _storage_index(self, user_id, event_id):
+        event = self._user_index(user_id).get(event_id)
+        if event is None:
+            return None
+        return self._read()[user_id]["events"].index(event)
+
+    def remove_task(self, user_id, index):
+        with self._lock:
+            self._user_index(user_id)
+            events = self._read().get(user_id, {}).get("events", [])
+            if 0 <= index < len(events):
+                self._move_to_backlog(user_id, index)
+                return True
+            return False
+
+    def remove_event(self, user_id, event_id):
+        """Move the event with this id to the backlog. Returns the removed event or None."""
+        with self._lock:
+            storage_index = self._storage_index(user_id, event_id)
+            if storage_index is None:
+                return None
+            return self._move_to_backlog(user_id, storage_index)
+
+    def list_users(self):
+        with self._lock:
+            return [user_id for user_id in self._read()]
+
+    def get_user(self, user_id):
+        """A copy of the user's record, safe to read while other threads mutate storage."""
+        with self._lock:
+            return copy.deepcopy(self._read().get(user_id, {}))
+
+    def list_backlog(self, user_id, year=None, month=None):
+        """Backlog events, optionally only those in a year and/or month."""
+        with self._lock:
+            events = list(self._read().get(user_id, {}).get("backlog", []))
+            if self.archive is not None:
+                pending = events + [e for u, e in self._cold_pending if u == user_id]
+                seen = set()
+                events = []
+                # only the partitions for the requested months are opened
+                for e in self.archive.query(user_id, year, month) + pending:
+                    key = event_key(e["text"], e.get("date"))
+                    if key not in seen:
+                        seen.add(key)
+                        events.append(e)
+            if year or month:
+                events = [e for e in events if matches_date_filter(e.get("date"), year, month)]
+            return events
 
     def archive_event(self, user_id, event):
         """Move a specific event to backlog by matching its text and date."""
-        data = self._read()
-        events = data.get(user_id, {}).get("events", [])
-        for i, e in enumerate(events):
-            if e["text"] == event["text"] and e.get("date") == event.get("date"):
-                removed = events.pop(i)
-                # Add to backlog if not duplicate
-                data[user_id].setdefault("backlog", [])
-                if not self._event_exists(data[user_id]["backlog"], removed["text"], removed.get("date")):
-                    data[user_id]["backlog"].append(removed)
-                self._write(data)
-                return True
-        return False
+        with self._lock:
+            if user_id not in self._read():
+                return False
+            found = self._user_index(user_id).find(event["text"], event.get("date"))
+            if found is None:
+                return False
+            self._move_to_backlog(user_id, self._storage_index(user_id, found["id"]))
+            return True
+
+    def _replace_event(self, user_id, storage_index, text, date):
+        events = self._read()[user_id]["events"]
+        index = self._user_index(user_id)
+        old = events[storage_index]
+        index.remove(old["id"])
+        events[storage_index] = event_record(text, date.strftime("%Y-%m-%d") if date != datetime.max else None)
+        events[storage_index]["id"] = old["id"]
+        self._mark_dirty(user_id)
+        return index.add(events[storage_index])
 
     def edit_task(self, user_id, index, text, date):
-        data = self._read()
-        events = data.get(user_id, {}).get("events", [])
-        if 0 <= index < len(events):
-            events[index] = {
-                "text": text,
-                "date": date.strftime("%Y-%m-%d") if date != datetime.max else None
-            }
-            self._write(data)
-            return True
-        return False
+        with self._lock:
+            self._user_index(user_id)
+            events = self._read().get(user_id, {}).get("events", [])
+            if 0 <= index < len(events):
+                self._replace_event(user_id, index, text, date)
+                return True
+            return False
+
+    def edit_event(self, user_id, event_id, text, date):
+        """Replace the event with this id, keeping the id. Returns its new display position or None."""
+        with self._lock:
+            storage_index = self._storage_index(user_id, event_id)
+            if storage_index is None:
+                return None
+            return self._replace_event(user_id, storage_index, text, date)
 
     def set_reminder_time(self, user_id, reminder_time):
-        data = self._read()
-        if user_id not in data:
-            data[user_id] = {"events": [], "reminder_time": reminder_time}
-        else:
-            data[user_id]["reminder_time"] = reminder_time
-        self._write(data)
-        return True
+        with self._lock:
+            data = self._read()
+            if user_id not in data:
+                data[user_id] = {"events": [], "reminder_time": reminder_time}
+            else:
+                data[user_id]["reminder_time"] = reminder_time
+            self._mark_dirty(user_id)
+            return True
 
     def set_timezone(self, user_id, offset):
-        data = self._read()
-        if user_id not in data:
-            data[user_id] = {"events": [], "timezone": offset}
-        else:
-            data[user_id]["timezone"] = offset
-        self._write(data)
-        return True
-
-    def _read_birthdays(self):
-        try:
-            with open('birthdays.json', 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _write_birthdays(self, data):
-        with open('birthdays.json', 'w') as f:
-            json.dump(data, f, indent=2)
+        with self._lock:
+            data = self._read()
+            if user_id not in data:
+                data[user_id] = {"events": [], "timezone": offset}
+            else:
+                data[user_id]["timezone"] = offset
+            self._mark_dirty(user_id)
+            return True
+
+    def _birthday_index(self):
+        """{owner: {'MM-DD': [names]}} loaded once; owner None holds the shared entries."""
+        if self._birthdays is None:
+            raw = load_with_backups(self.birthdays_filename, json.loads, self.backups)
+            index = {None: {}}
+            # top-level "MM-DD": "a/b" entries predate owners and stay visible to everyone
+            for date_key, names_str in raw.items():
+                if date_key != "by_user":
+                    index[None][date_key] = [n.strip() for n in names_str.split("/") if n.strip()]
+            for owner, dates in raw.get("by_user", {}).items():
+                index[owner] = {date_key: [n.strip() for n in names_str.split("/") if n.strip()]
+                                for date_key, names_str in dates.items()}
+            self._birthdays = index
+        return self._birthdays
+
+    def _write_birthdays(self):
+        raw = {date_key: "/".join(names) for date_key, names in self._birthdays[None].items()}
+        by_user = {owner: {date_key: "/".join(names) for date_key, names in dates.items()}
+                   for owner, dates in self._birthdays.items() if owner is not None and dates}
+        if by_user:
+            raw["by_user"] = by_user
+        atomic_write(self.birthdays_filename, json.dumps(raw, indent=2).encode(), self.backups)
 
     def add_birthday(self, user_id, date_key, name):
-        """Add a birthday. date_key is 'MM-DD', name is a string."""
-        birthdays = self._read_birthdays()
-        existing = birthdays.get(date_key, "")
-        existing_names = [n.strip() for n in existing.split("/") if n.strip()] if existing else []
-        if name.lower() in [n.lower() for n in existing_names]:
-            return False
-        existing_names.append(name)
-        birthdays[date_key] = "/".join(existing_names)
-        self._write_birthdays(birthdays)
-        return True
+        """Add a birthday owned by user_id. date_key is 'MM-DD', name is a string."""
+        with self._lock:
+            if name.lower() in [n.lower() for n in self.birthdays_on(user_id, date_key)]:
+                return False
+            self._birthday_index().setdefault(user_id, {}).setdefault(date_key, []).append(name)
+            self._write_birthdays()
+            return True
 
     def remove_birthday(self, user_id, date_key, name):
-        """Remove a birthday by name from a date."""
-        birthdays = self._read_birthdays()
-        existing = birthdays.get(date_key, "")
-        if not existing:
+        """Remove a birthday by name from a date, preferring the user's own entry over a shared one."""
+        with self._lock:
+            index = self._birthday_index()
+            for owner in (user_id, None):
+                names = index.get(owner, {}).get(date_key, [])
+                for i, n in enumerate(names):
+                    if n.lower() == name.lower():
+                        names.pop(i)
+                        if not names:
+                            del index[owner][date_key]
+                        self._write_birthdays()
+                        return True
             return False
-        existing_names = [n.strip() for n in existing.split("/") if n.strip()]
-        for i, n in enumerate(existing_names):
-            if n.lower() == name.lower():
-                existing_names.pop(i)
-                if not existing_names:
-                    del birthdays[date_key]
-                else:
-                    birthdays[date_key] = "/".join(existing_names)
-                self._write_birthdays(birthdays)
-                return True
-        return False
+
+    def birthdays_on(self, user_id, date_key):
+        """Names with a birthday on 'MM-DD' visible to user_id."""
+        with self._lock:
+            index = self._birthday_index()
+            return index[None].get(date_key, []) + index.get(user_id, {}).get(date_key, [])
 
     def list_birthdays(self, user_id):
         """Return birthdays dict: {'MM-DD': ['name1', 'name2'], ...}"""
-        birthdays = self._read_birthdays()
-        result = {}
-        for date_key, names_str in birthdays.items():
-            result[date_key] = [n.strip() for n in names_str.split("/") if n.strip()]
-        return result
+        with self._lock:
+            index = self._birthday_index()
+            result = {date_key: list(names) for date_key, names in index[None].items()}
+            for date_key, names in index.get(user_id, {}).items():
+                result.setdefault(date_key, []).extend(names)
+            return result
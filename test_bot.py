@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import glob
 import os
 import tempfile
 from datetime import datetime
@@ -8,6 +10,21 @@ from utils import get_date, strip_year, sort_key, extract_time
 USER_ID = "123"
 
 
+@pytest.fixture
+def storage_path():
+    """A temp file for Storage; its .tmp, backups and other siblings are removed afterwards."""
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    yield path
+    for leftover in glob.glob(path + '*'):
+        os.unlink(leftover)
+
+
+@pytest.fixture
+def storage(storage_path):
+    return Storage(storage_path)
+
+
 class TestGetDate:
     def test_with_year_uses_that_year(self):
         result = get_date("jan 1 2026 happy new year")
@@ -56,6 +73,24 @@ class TestExtractTime:
         assert extract_time("jan 7 event") is None
 
 
+class TestParseEventText:
+    def test_single_result(self):
+        from utils import parse_event_text
+        parsed = parse_event_text("Jan 7 2026 9:30pm dinner")
+        assert (parsed.month, parsed.day, parsed.year) == (1, 7, 2026)
+        assert (parsed.hour, parsed.minute, parsed.ampm, parsed.rollover) == (21, 30, "pm", False)
+        assert parsed.display == "Jan 7 9:30pm dinner"
+        with pytest.raises(AttributeError):
+            parsed.hour = 1
+
+    def test_rollover_and_missing_parts(self):
+        from utils import parse_event_text, parse_many
+        midnight, undated = parse_many(["jan 7 24:00 deadline", "do laundry"])
+        assert midnight.year is None and midnight.hour == 24 and midnight.rollover
+        assert undated.month is None and undated.hour is None and undated.display == "do laundry"
+        assert parse_many(["do laundry"])[0] is undated
+
+
 class TestSortKey:
     def test_dated_before_undated(self):
         dated = {"text": "jan 1 party", "date": "2025-01-01"}
@@ -80,15 +115,22 @@ class TestSortKey:
         assert sort_key(late) < sort_key(midnight) < sort_key(next_day)
 
 
+class TestEventFields:
+    def test_derived_fields_on_add(self):
+        from utils import event_record
+        assert event_record("jan 7 24:00 deadline", "2025-01-07") == {
+            "text": "jan 7 24:00 deadline", "date": "2025-01-07", "local": "2025-01-08 00:00", "has_time": True
+        }
+        assert event_record("do laundry", None)["local"] is None
+
+    def test_legacy_event_backfilled(self):
+        from utils import get_event_utc_datetime
+        legacy = {"text": "feb 4 10:30 meeting", "date": "2026-02-04"}
+        assert get_event_utc_datetime(legacy, -5) == datetime(2026, 2, 4, 15, 30)
+        assert legacy["has_time"] is True
+
+
 class TestStorage:
-    @pytest.fixture
-    def storage(self):
-        fd, path = tempfile.mkstemp(suffix=".json")
-        os.close(fd)
-        s = Storage(path)
-        yield s
-        os.unlink(path)
-    
     def test_add_task_with_year(self, storage):
         date = datetime(2026, 1, 1)
         storage.add_task(USER_ID, "jan 1 happy new year", date)
@@ -150,6 +192,985 @@ class TestStorage:
         assert events == []
 
 
+class TestEventIndex:
+    def test_add_returns_display_position(self, storage):
+        assert storage.add_task(USER_ID, "do laundry", datetime.max) == 1
+        assert storage.add_task(USER_ID, "feb 1 b", datetime(2026, 2, 1)) == 1
+        assert storage.add_task(USER_ID, "jan 1 a", datetime(2026, 1, 1)) == 1
+        assert storage.add_task(USER_ID, "mar 1 c", datetime(2026, 3, 1)) == 3
+        assert [e["text"] for e in storage.sorted_tasks(USER_ID)] == ["jan 1 a", "feb 1 b", "mar 1 c", "do laundry"]
+
+    def test_ids_are_stable(self, storage):
+        storage.add_task(USER_ID, "feb 1 b", datetime(2026, 2, 1))
+        storage.add_task(USER_ID, "jan 1 a", datetime(2026, 1, 1))
+        event = storage.task_at(USER_ID, 2)
+        assert storage.edit_event(USER_ID, event["id"], "dec 1 b", datetime(2025, 12, 1)) == 1
+        assert storage.task_at(USER_ID, 1)["id"] == event["id"]
+        assert storage.remove_event(USER_ID, event["id"])["text"] == "dec 1 b"
+        assert storage.remove_event(USER_ID, event["id"]) is None
+        assert [e["text"] for e in storage.sorted_tasks(USER_ID)] == ["jan 1 a"]
+
+    def test_legacy_events_get_ids(self, storage):
+        storage._read()[USER_ID] = {"events": [{"text": "b", "date": None}, {"text": "a", "date": None}]}
+        assert [e["id"] for e in storage.sorted_tasks(USER_ID)] == [2, 1]
+        storage.add_task(USER_ID, "c", datetime.max)
+        assert storage.task_at(USER_ID, 3)["id"] == 3
+
+    def test_identity_index_tracks_mutations(self, storage):
+        storage.add_task(USER_ID, "feb 1  party", datetime(2026, 2, 1))
+        assert storage.add_task(USER_ID, "feb 1 party", datetime(2026, 2, 1)) is False
+        event = storage.task_at(USER_ID, 1)
+        storage.edit_event(USER_ID, event["id"], "feb 1 dinner", datetime(2026, 2, 1))
+        assert storage.add_task(USER_ID, "feb 1 party", datetime(2026, 2, 1)) == 2
+        assert storage.archive_event(USER_ID, {"text": "feb 1 dinner", "date": "2026-02-01"}) is True
+        assert storage.archive_event(USER_ID, {"text": "feb 1 dinner", "date": "2026-02-01"}) is False
+        assert storage.add_task(USER_ID, "feb 1 dinner", datetime(2026, 2, 1)) == 2
+        storage.remove_event(USER_ID, storage.task_at(USER_ID, 2)["id"])
+        # already in the backlog, so it isn't added twice
+        assert [e["text"] for e in storage.list_backlog(USER_ID)] == ["feb 1 dinner"]
+
+
+class TestStorageCache:
+    def test_debounced_write_flushes_on_close(self, storage_path):
+        storage = Storage(storage_path, flush_interval=60)
+        storage.add_task(USER_ID, "task 1", datetime(2025, 1, 1))
+        assert storage.list_tasks(USER_ID)[0]["text"] == "task 1"
+        assert Storage(storage_path).list_tasks(USER_ID) == []
+        storage.close()
+        assert Storage(storage_path).list_tasks(USER_ID)[0]["text"] == "task 1"
+        assert not os.path.exists(storage_path + ".tmp")
+
+    def test_write_through_by_default(self, storage_path):
+        Storage(storage_path).set_timezone(USER_ID, -5)
+        assert Storage(storage_path).get_user(USER_ID)["timezone"] == -5
+
+    def test_corrupt_file_restored_from_backup(self, storage_path):
+        storage = Storage(storage_path, backups=2)
+        storage.add_task(USER_ID, "task 1", datetime.max)
+        storage.add_task(USER_ID, "task 2", datetime.max)
+        # a torn write from a crash under the old in-place writer
+        with open(storage_path, "w") as f:
+            f.write('{"123": {"ev')
+        restored = Storage(storage_path, backups=2)
+        assert [e["text"] for e in restored.list_tasks(USER_ID)] == ["task 1"]
+        with open(storage_path + ".corrupt") as f:
+            assert f.read() == '{"123": {"ev'
+
+    def test_corrupt_file_without_backups_is_kept(self, storage_path):
+        with open(storage_path, "w") as f:
+            f.write('{"123": ')
+        storage = Storage(storage_path, backups=0)
+        assert storage.list_users() == []
+        assert open(storage_path).read() == '{"123": ' and os.path.exists(storage_path + ".corrupt")
+
+    def test_group_commit_shares_one_flush(self, storage_path, monkeypatch):
+        from async_storage import AsyncStorage
+        backend = Storage(storage_path, commit_window=0.05)
+        writes = []
+        write = backend._write
+        monkeypatch.setattr(backend, "_write", lambda data: (writes.append(1), write(data)))
+        storage = AsyncStorage(backend)
+
+        async def run():
+            await asyncio.gather(*[storage.add_task(str(i), "task", datetime.max) for i in range(20)])
+            # every awaited add is already on disk
+            on_disk = Storage(storage_path).list_users()
+            await storage.close()
+            return on_disk
+
+        assert len(asyncio.run(run())) == 20
+        assert len(writes) == 1 and backend._committer.commits == 1
+
+    def test_get_user_returns_copy(self, storage_path):
+        storage = Storage(storage_path)
+        storage.add_task(USER_ID, "task 1", datetime.max)
+        user_data = storage.get_user(USER_ID)
+        storage.add_task(USER_ID, "task 2", datetime.max)
+        user_data["events"].clear()
+        assert len(user_data["events"]) == 0 and len(storage.list_tasks(USER_ID)) == 2
+
+    def test_list_tasks_returns_copy(self, storage_path):
+        storage = Storage(storage_path)
+        storage.add_task(USER_ID, "task 1", datetime(2025, 1, 1))
+        storage.list_tasks(USER_ID).pop()
+        assert len(storage.list_tasks(USER_ID)) == 1
+
+
+class TestSqliteStorage:
+    @pytest.fixture
+    def storage(self, tmp_path):
+        from sqlite_storage import SqliteStorage
+        s = SqliteStorage(str(tmp_path / "storage.db"))
+        yield s
+        s.close()
+
+    def test_add_list_remove(self, storage):
+        assert storage.add_task(USER_ID, "task 1", datetime(2025, 1, 1))
+        assert storage.add_task(USER_ID, "task 2", datetime.max)
+        assert not storage.add_task(USER_ID, "task 2", datetime.max)
+        assert [(e["text"], e["date"]) for e in storage.list_tasks(USER_ID)] == [
+            ("task 1", "2025-01-01"),
+            ("task 2", None),
+        ]
+        assert storage.remove_task(USER_ID, 0)
+        assert [e["text"] for e in storage.list_tasks(USER_ID)] == ["task 2"]
+        backlog = storage.list_backlog(USER_ID)
+        assert [(e["text"], e["local"], e["has_time"]) for e in backlog] == [("task 1", "2025-01-01 00:00", False)]
+
+    def test_backlog_duplicates_match_json_backend(self, storage, tmp_path):
+        json_side = Storage(str(tmp_path / "storage.json"))
+        for backend in (storage, json_side):
+            for text in ("jan 5  trip", "jan 5 trip "):
+                backend.add_task(USER_ID, text, datetime(2026, 1, 5))
+                backend.remove_task(USER_ID, 0)
+        assert len(storage.list_backlog(USER_ID)) == len(json_side.list_backlog(USER_ID)) == 1
+
+    def test_display_positions(self, storage):
+        assert storage.add_task(USER_ID, "feb 1 b", datetime(2026, 2, 1)) == 1
+        assert storage.add_task(USER_ID, "jan 1 a", datetime(2026, 1, 1)) == 1
+        event = storage.task_at(USER_ID, 2)
+        assert event["text"] == "feb 1 b"
+        assert storage.edit_event(USER_ID, event["id"], "dec 1 b", datetime(2025, 12, 1)) == 1
+        assert storage.remove_event(USER_ID, event["id"])["text"] == "dec 1 b"
+        assert [e["text"] for e in storage.sorted_tasks(USER_ID)] == ["jan 1 a"]
+
+    def test_events_due_between_follows_timezone(self, storage):
+        storage.add_task(USER_ID, "feb 4 10:30 meeting", datetime(2026, 2, 4))
+        storage.set_timezone(USER_ID, -5)
+        due = storage.events_due_between(datetime(2026, 2, 4, 15, 0), datetime(2026, 2, 4, 16, 0))
+        assert [(user_id, e["text"], due_utc) for user_id, e, due_utc in due] == [
+            (USER_ID, "feb 4 10:30 meeting", datetime(2026, 2, 4, 15, 30))
+        ]
+
+    def test_migrate_from_json(self, storage, tmp_path):
+        import json
+        (tmp_path / "storage.json").write_text(json.dumps({
+            USER_ID: {"events": [{"text": "task 1", "date": None}], "backlog": [], "timezone": 9}
+        }))
+        (tmp_path / "birthdays.json").write_text(json.dumps({"07-22": "alice/bob", "by_user": {"9": {"07-01": "carol"}}}))
+        storage.migrate_from_json(str(tmp_path / "storage.json"), str(tmp_path / "birthdays.json"))
+        assert storage.get_user(USER_ID)["timezone"] == 9
+        assert [e["text"] for e in storage.list_tasks(USER_ID)] == ["task 1"]
+        assert storage.list_birthdays(USER_ID) == {"07-22": ["alice", "bob"]}
+        assert storage.list_birthdays("9") == {"07-22": ["alice", "bob"], "07-01": ["carol"]}
+        assert not storage.add_birthday(USER_ID, "07-22", "Alice")
+
+    def test_migrate_includes_cold_archive(self, storage, tmp_path):
+        from archive import ColdArchive
+        json_side = Storage(str(tmp_path / "storage.json"), birthdays_filename=str(tmp_path / "birthdays.json"),
+                            archive=ColdArchive(str(tmp_path / "archive")))
+        json_side.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        json_side.add_task(USER_ID, "do laundry", datetime.max)
+        json_side.remove_task(USER_ID, 0)
+        json_side.close()
+        ColdArchive(str(tmp_path / "archive"), compress=False).append("456", [{"text": "old", "date": None}])
+        storage.migrate_from_json(str(tmp_path / "storage.json"), str(tmp_path / "birthdays.json"),
+                                  str(tmp_path / "archive"))
+        assert [e["text"] for e in storage.list_backlog(USER_ID)] == ["feb 3 party"]
+        assert [e["text"] for e in storage.list_backlog("456")] == ["old"]
+        assert [e["text"] for e in storage.list_tasks(USER_ID)] == ["do laundry"]
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.dm_channel = None
+        self.sent = []
+
+    async def create_dm(self):
+        self.dm_channel = self
+        return self
+
+    async def send(self, msg):
+        self.sent.append(msg)
+
+
+class FakeClient:
+    def __init__(self, cached=()):
+        self.cached = {user_id: FakeUser(user_id) for user_id in cached}
+        self.fetches = []
+
+    def get_user(self, user_id):
+        return self.cached.get(user_id)
+
+    async def fetch_user(self, user_id):
+        self.fetches.append(user_id)
+        await asyncio.sleep(0)
+        return FakeUser(user_id)
+
+
+class TestUserResolver:
+    def test_concurrent_fetches_deduplicated(self):
+        from resolver import UserResolver
+        client = FakeClient()
+        resolver = UserResolver(client)
+
+        async def run():
+            users = await asyncio.gather(*[resolver.resolve("1") for _ in range(5)])
+            assert all(u is users[0] for u in users)
+            await resolver.resolve(1)
+
+        asyncio.run(run())
+        assert client.fetches == [1]
+        assert resolver.stats() == {"hits": 1, "misses": 1, "coalesced": 4, "cached": 1}
+
+    def test_client_cache_checked_first(self):
+        from resolver import UserResolver
+        client = FakeClient(cached=[7])
+        resolver = UserResolver(client)
+        channel = asyncio.run(resolver.dm_channel("7"))
+        assert channel is client.cached[7]
+        assert client.fetches == []
+
+    def test_lru_and_ttl_eviction(self):
+        from resolver import UserResolver
+        client = FakeClient()
+        resolver = UserResolver(client, maxsize=2)
+
+        async def run():
+            for user_id in (1, 2, 1, 3, 2):
+                await resolver.resolve(user_id)
+
+        asyncio.run(run())
+        # 2 was least recently used when 3 arrived
+        assert client.fetches == [1, 2, 3, 2]
+        expired = UserResolver(client, ttl=-1)
+        asyncio.run(expired.resolve(5))
+        asyncio.run(expired.resolve(5))
+        assert client.fetches[-2:] == [5, 5]
+
+
+class FlakyChannel:
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send(self, msg):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(msg)
+
+
+class FakeResolver:
+    def __init__(self, channels):
+        self.channels = channels
+
+    async def dm_channel(self, user_id):
+        return self.channels[user_id]
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TestDMDispatcher:
+    def run_dispatcher(self, channels, messages, **kwargs):
+        from dispatcher import DMDispatcher
+        dispatcher = DMDispatcher(FakeResolver(channels), base_delay=0, **kwargs)
+
+        async def run():
+            dispatcher.start()
+            for user_id, msg in messages:
+                dispatcher.enqueue(user_id, msg)
+            await dispatcher.stop()
+
+        asyncio.run(run())
+        return dispatcher
+
+    def test_per_user_order_kept(self):
+        channels = {"1": FlakyChannel([]), "2": FlakyChannel([])}
+        messages = [("1", "a"), ("2", "x"), ("1", "b"), ("1", "c")]
+        dispatcher = self.run_dispatcher(channels, messages)
+        assert channels["1"].sent == ["a", "b", "c"]
+        assert channels["2"].sent == ["x"]
+        assert dispatcher.stats()["sent"] == 4
+        assert len(dispatcher.latencies) == 4
+
+    def test_rate_limited_send_retried(self):
+        channels = {"1": FlakyChannel([FakeHTTPError(429, retry_after=0), FakeHTTPError(503)])}
+        dispatcher = self.run_dispatcher(channels, [("1", "a")])
+        assert channels["1"].sent == ["a"]
+        assert dispatcher.retries == 2
+
+    def test_rate_limited_user_does_not_block_others(self):
+        from dispatcher import DMDispatcher, SENT
+        log = []
+
+        class LoggingChannel(FlakyChannel):
+            async def send(self, msg):
+                await super().send(msg)
+                log.append(msg)
+
+        channels = {"1": LoggingChannel([FakeHTTPError(429, retry_after=0.2)]), "2": LoggingChannel([])}
+        outcomes = []
+        dispatcher = DMDispatcher(FakeResolver(channels), workers=2, base_delay=0)
+
+        async def run():
+            dispatcher.start()
+            for msg in ("a1", "a2", "a3", "a4"):
+                dispatcher.enqueue("1", msg, outcomes.append)
+            dispatcher.enqueue("2", "b1", outcomes.append)
+            await dispatcher.stop()
+
+        asyncio.run(run())
+        # b1 went out while user 1 waited out its retry_after, and user 1 kept its order
+        assert log == ["b1", "a1", "a2", "a3", "a4"]
+        assert outcomes == [SENT] * 5 and dispatcher.stats()["queued"] == 0
+
+    def test_enqueue_all_reports_once_when_every_message_settles(self):
+        from dispatcher import DMDispatcher, SENT, GAVE_UP
+        channels = {"1": FlakyChannel([]), "2": FlakyChannel([FakeHTTPError(503)] * 2)}
+        outcomes = []
+        dispatcher = DMDispatcher(FakeResolver(channels), base_delay=0, max_retries=1)
+
+        async def run():
+            dispatcher.start()
+            dispatcher.enqueue_all("1", ["a", "b"], lambda outcome: outcomes.append(("1", outcome)))
+            dispatcher.enqueue_all("2", ["x", "y"], lambda outcome: outcomes.append(("2", outcome)))
+            dispatcher.enqueue_all("3", [], lambda outcome: outcomes.append(("3", outcome)))
+            await dispatcher.stop()
+
+        asyncio.run(run())
+        # x gave up after its retry, so user 2's delivery as a whole isn't recorded as sent
+        assert sorted(outcomes) == [("1", SENT), ("2", GAVE_UP), ("3", SENT)]
+        assert channels["2"].sent == ["y"]
+
+    def test_forbidden_not_retried(self):
+        channels = {"1": FlakyChannel([FakeHTTPError(403)]), "2": FlakyChannel([])}
+        dispatcher = self.run_dispatcher(channels, [("1", "a"), ("2", "b")])
+        assert channels["1"].sent == []
+        assert channels["2"].sent == ["b"]
+        assert (dispatcher.failed, dispatcher.retries) == (1, 0)
+
+
+class TestAsyncStorage:
+    def test_calls_run_off_the_event_loop(self, tmp_path):
+        import threading
+        from async_storage import AsyncStorage
+        storage = AsyncStorage(Storage(str(tmp_path / "storage.json")))
+
+        async def run():
+            positions = await asyncio.gather(*[
+                storage.add_task(USER_ID, f"task {i}", datetime.max) for i in range(5)
+            ])
+            thread = await storage.call(lambda: threading.current_thread().name)
+            events = await storage.sorted_tasks(USER_ID)
+            await storage.close()
+            return positions, thread, events
+
+        positions, thread, events = asyncio.run(run())
+        # the writer thread applies mutations in the order they were awaited
+        assert positions == [1, 2, 3, 4, 5]
+        assert thread.startswith("storage-read")
+        assert [e["text"] for e in events] == [f"task {i}" for i in range(5)]
+
+    def test_concurrent_appends_are_not_lost(self, tmp_path):
+        from async_storage import AsyncStorage
+        from engine import CommandEngine
+        storage = AsyncStorage(Storage(str(tmp_path / "storage.json")))
+        engine = CommandEngine(storage)
+
+        async def run():
+            await storage.add_task(USER_ID, "todo", datetime.max)
+            await asyncio.gather(*[engine.handle(USER_ID, f"type append 1 {word}") for word in "abcd"],
+                                 engine.handle("456", "type add other user"))
+            events = await storage.sorted_tasks(USER_ID)
+            await storage.close()
+            return events
+
+        (event,) = asyncio.run(run())
+        assert event["text"] == "todo a b c d"
+        # the user lock serialised the appends, so none had to retry
+        assert storage.conflicts == 0
+
+    def test_update_retries_after_a_conflicting_write(self, tmp_path):
+        from async_storage import AsyncStorage
+        from storage import StorageBatch
+        backend = Storage(str(tmp_path / "storage.json"))
+        backend.add_task(USER_ID, "a", datetime.max)
+        backend.add_task(USER_ID, "b", datetime.max)
+        storage = AsyncStorage(backend)
+        attempts = []
+
+        async def build():
+            event = await storage.task_at(USER_ID, 1)
+            if not attempts:
+                # the reminder loop archives the event between our read and our write
+                backend.archive_event(USER_ID, event)
+            attempts.append(event["text"])
+            batch = StorageBatch()
+            batch.edit_event(USER_ID, event["id"], event["text"] + "!", datetime.max)
+            return batch
+
+        async def run():
+            results = await storage.update(USER_ID, build)
+            await storage.close()
+            return results
+
+        assert asyncio.run(run()) == [True]
+        assert attempts == ["a", "b"] and storage.conflicts == 1
+        assert [e["text"] for e in backend.list_tasks(USER_ID)] == ["b!"]
+
+
+class TestBench:
+    def test_small_run_and_compare(self):
+        import bench
+        results = bench.run(users=3, events=4, backlog=2, birthdays=5, repeat=1)
+        assert results["reminder_tick"]["ops"] == 3
+        assert results["birthdays_on"]["ops"] == 3
+        slower = {name: dict(r, per_op=r["per_op"] * 2) for name, r in results.items()}
+        assert bench.compare(results, results, 0.2) == []
+        assert set(bench.compare(slower, results, 0.2)) == {n for n, r in results.items() if r["per_op"] > 0}
+
+
+class TestTickStats:
+    def test_phases_and_counters(self, tmp_path):
+        import json
+        from metrics import TickStats, write_metrics
+        stats = TickStats()
+        with stats.timer("due"):
+            pass
+        stats.record("send", 2.0)
+        stats.incr("overruns")
+        snapshot = stats.snapshot()
+        assert snapshot["phases"]["due"]["count"] == 1
+        assert snapshot["phases"]["send"]["buckets"] == {"<=5": 1}
+        assert snapshot["counters"] == {"overruns": 1}
+        assert "send: n=1" in stats.format()
+        write_metrics(str(tmp_path / "metrics.json"), snapshot)
+        assert json.loads((tmp_path / "metrics.json").read_text())["counters"] == {"overruns": 1}
+
+
+class TestBirthdayIndex:
+    @pytest.fixture
+    def storage(self, tmp_path):
+        import json
+        (tmp_path / "birthdays.json").write_text(json.dumps({"02-04": "jason", "07-22": "alice/bob"}))
+        return Storage(str(tmp_path / "storage.json"), birthdays_filename=str(tmp_path / "birthdays.json"))
+
+    def test_shared_and_owned_birthdays(self, storage):
+        assert storage.add_birthday(USER_ID, "07-22", "carol")
+        assert not storage.add_birthday(USER_ID, "07-22", "Alice")
+        assert storage.birthdays_on(USER_ID, "07-22") == ["alice", "bob", "carol"]
+        assert storage.birthdays_on("456", "07-22") == ["alice", "bob"]
+        assert storage.list_birthdays("456") == {"02-04": ["jason"], "07-22": ["alice", "bob"]}
+
+    def test_mutations_persist(self, storage, tmp_path):
+        storage.add_birthday(USER_ID, "12-25", "santa")
+        storage.remove_birthday(USER_ID, "02-04", "jason")
+        reloaded = Storage(storage.filename, birthdays_filename=str(tmp_path / "birthdays.json"))
+        assert reloaded.list_birthdays(USER_ID) == {"07-22": ["alice", "bob"], "12-25": ["santa"]}
+        assert reloaded.list_birthdays("456") == {"07-22": ["alice", "bob"]}
+
+
+class TestImport:
+    def test_text_lines(self):
+        from importer import parse_import
+        items = list(parse_import(["jan 15 2026 10:30 dentist\n", "\n", "do laundry\n"]))
+        assert items == [("jan 15 10:30 dentist", datetime(2026, 1, 15)), ("do laundry", datetime.max)]
+
+    def test_csv_columns(self):
+        from importer import parse_import
+        lines = ["Subject,Start Date,Start Time\n", "dentist,03/15/2026,10:30\n", "party,2026-04-01,\n"]
+        assert list(parse_import(lines, 'csv')) == [
+            ("mar 15 10:30 dentist", datetime(2026, 3, 15)),
+            ("apr 1 party", datetime(2026, 4, 1)),
+        ]
+
+    def test_ics_events(self):
+        from importer import parse_import, detect_format
+        content = ("BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nDTSTART:20260315T103000Z\r\nSUMMARY:team\r\n  sync\r\n"
+                   "END:VEVENT\r\nBEGIN:VEVENT\r\nDTSTART;VALUE=DATE:20260401\r\nSUMMARY:rent\r\nEND:VEVENT\r\n"
+                   "END:VCALENDAR\r\n")
+        assert detect_format("cal.txt", content) == 'ics'
+        # 10:30 UTC is 05:30 at UTC-5
+        assert list(parse_import(content.splitlines(True), 'ics', tz_offset=-5)) == [
+            ("mar 15 05:30 team sync", datetime(2026, 3, 15)),
+            ("apr 1 rent", datetime(2026, 4, 1)),
+        ]
+        late = content.replace("DTSTART:20260315T103000Z", "DTSTART:20260315T223000Z")
+        assert list(parse_import(late.splitlines(True), 'ics', tz_offset=9))[0] == (
+            "mar 16 07:30 team sync", datetime(2026, 3, 16))
+
+    def test_invalid_dates_are_reported_not_raised(self):
+        from importer import parse_import
+        errors = []
+        items = list(parse_import(["feb 30 bad\n", "mar 1 good\n"], errors=errors))
+        assert [text for text, _ in items] == ["mar 1 good"] and errors == ["feb 30 bad"]
+        lines = ["text,date\n", "feb 30 bad,\n", "ok,2026-05-01\n"]
+        assert [text for text, _ in parse_import(lines, 'csv', errors=errors)] == ["may 1 ok"]
+        assert errors == ["feb 30 bad", "feb 30 bad"]
+        lines = ["text,date,time\n", "standup,2026-05-01,10:75\n"]
+        assert list(parse_import(["jan 6 10:75 meeting\n"], errors=errors)) == []
+        assert list(parse_import(lines, 'csv', errors=errors)) == []
+        assert errors[2:] == ["jan 6 10:75 meeting", "standup"]
+
+    def test_add_tasks_is_all_or_nothing(self, tmp_path):
+        storage = Storage(str(tmp_path / "storage.json"))
+        items = [("jan 5 fine", datetime(2026, 1, 5)), ("jan 6 10:75 meeting", datetime(2026, 1, 6))]
+        with pytest.raises(ValueError):
+            storage.add_tasks(USER_ID, items)
+        assert storage.list_tasks(USER_ID) == [] and storage.sorted_tasks(USER_ID) == []
+
+    def test_export_round_trip_with_bulk_add(self, tmp_path):
+        import io
+        from importer import parse_import, export_csv
+        storage = Storage(str(tmp_path / "storage.json"))
+        storage.add_task(USER_ID, "mar 15 dentist", datetime(2027, 3, 15))
+        storage.add_task(USER_ID, "old", datetime.max)
+        storage.remove_task(USER_ID, 1)
+        content = export_csv(storage.sorted_tasks(USER_ID), storage.list_backlog(USER_ID))
+        items = list(parse_import(io.StringIO(content), 'csv'))
+        assert items == [("mar 15 dentist", datetime(2027, 3, 15))]
+
+        other = Storage(str(tmp_path / "other.json"))
+        assert other.add_tasks(USER_ID, items + items) == (1, 1)
+        assert other.list_tasks(USER_ID)[0]["date"] == "2027-03-15"
+
+
+class TestStorageBatch:
+    def test_batch_applies_with_one_flush(self, tmp_path, monkeypatch):
+        storage = Storage(str(tmp_path / "storage.json"))
+        for text in ("a", "b", "c"):
+            storage.add_task(USER_ID, text, datetime.max)
+        writes = []
+        monkeypatch.setattr(storage, "_write", lambda data: writes.append(1))
+        with storage.batch() as batch:
+            for event in storage.sorted_tasks(USER_ID)[:2]:
+                batch.remove_event(USER_ID, event["id"])
+            batch.archive_event(USER_ID, {"text": "c", "date": None})
+        assert [e["text"] for e in batch.results[:2]] == ["a", "b"] and batch.results[2] is True
+        assert len(writes) == 1
+        assert storage.list_tasks(USER_ID) == []
+        assert len(storage.list_backlog(USER_ID)) == 3
+
+    def test_failed_batch_rolls_back(self, tmp_path):
+        storage = Storage(str(tmp_path / "storage.json"))
+        storage.add_task(USER_ID, "a", datetime.max)
+        storage.add_task(USER_ID, "b", datetime.max)
+        event_id, other_id = [e["id"] for e in storage.sorted_tasks(USER_ID)]
+        # the bad edit fails after the remove has already been applied
+        with pytest.raises(AttributeError):
+            with storage.batch() as batch:
+                batch.remove_event(USER_ID, event_id)
+                batch.edit_event(USER_ID, other_id, "b", None)
+        assert [e["text"] for e in storage.sorted_tasks(USER_ID)] == ["a", "b"]
+        assert storage.list_backlog(USER_ID) == []
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_stale_expected_version_applies_nothing(self, tmp_path, backend):
+        from storage import StorageBatch, VersionConflict
+        from sqlite_storage import SqliteStorage
+        storage = Storage(str(tmp_path / "storage.json")) if backend == "json" else SqliteStorage(str(tmp_path / "s.db"))
+        storage.add_task(USER_ID, "a", datetime.max)
+        version = storage.version(USER_ID)
+        storage.add_task(USER_ID, "b", datetime.max)
+        batch = StorageBatch()
+        batch.remove_event(USER_ID, storage.task_at(USER_ID, 1)["id"])
+        batch.expect_version(USER_ID, version)
+        with pytest.raises(VersionConflict):
+            storage.apply_batch(batch)
+        assert len(storage.list_tasks(USER_ID)) == 2
+        batch.expect_version(USER_ID, storage.version(USER_ID))
+        storage.apply_batch(batch)
+        assert [e["text"] for e in storage.list_tasks(USER_ID)] == ["b"]
+        storage.close()
+
+    def test_sqlite_batch_rolls_back(self, tmp_path):
+        from sqlite_storage import SqliteStorage
+        storage = SqliteStorage(str(tmp_path / "storage.db"))
+        storage.add_task(USER_ID, "a", datetime.max)
+        storage.add_task(USER_ID, "b", datetime.max)
+        event_id, other_id = [e["id"] for e in storage.sorted_tasks(USER_ID)]
+        # the bad edit fails after the remove has already been applied
+        with pytest.raises(AttributeError):
+            with storage.batch() as batch:
+                batch.remove_event(USER_ID, event_id)
+                batch.edit_event(USER_ID, other_id, "b", None)
+        assert [e["text"] for e in storage.sorted_tasks(USER_ID)] == ["a", "b"]
+        with storage.batch() as batch:
+            batch.remove_event(USER_ID, event_id)
+        assert [e["text"] for e in storage.list_tasks(USER_ID)] == ["b"]
+        storage.close()
+
+
+class TestColdArchive:
+    def make_storage(self, tmp_path, **kwargs):
+        from archive import ColdArchive
+        archive = ColdArchive(str(tmp_path / "archive"), **kwargs)
+        return Storage(str(tmp_path / "storage.json"), archive=archive), archive
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="names fsynced files through /proc")
+    def test_archive_is_synced_before_storage_json(self, tmp_path, monkeypatch):
+        storage, archive = self.make_storage(tmp_path)
+        storage.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        order = []
+        fsync = os.fsync
+        monkeypatch.setattr(os, "fsync", lambda fd: (order.append(os.readlink(f"/proc/self/fd/{fd}")), fsync(fd)))
+        storage.remove_task(USER_ID, 0)
+        files = [os.path.basename(path) for path in order]
+        assert files.index("2026-02.jsonl.gz") < files.index("storage.json.tmp")
+
+    def test_removed_events_go_to_month_partitions(self, tmp_path):
+        storage, archive = self.make_storage(tmp_path)
+        storage.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        storage.add_task(USER_ID, "mar 9 exam", datetime(2026, 3, 9))
+        storage.add_task(USER_ID, "someday", datetime.max)
+        for event in storage.sorted_tasks(USER_ID):
+            storage.remove_event(USER_ID, event["id"])
+        assert archive.partitions(USER_ID) == {"2026-02", "2026-03", "undated"}
+        assert "backlog" not in storage.get_user(USER_ID)
+        assert [e["text"] for e in storage.list_backlog(USER_ID, 2026, 2)] == ["feb 3 party"]
+        assert len(storage.list_backlog(USER_ID)) == 3
+
+    def test_query_only_opens_matching_partitions(self, tmp_path, monkeypatch):
+        storage, archive = self.make_storage(tmp_path, compress=False)
+        storage.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        storage.add_task(USER_ID, "jan 5 trip", datetime(2025, 1, 5))
+        for event in storage.sorted_tasks(USER_ID):
+            storage.remove_event(USER_ID, event["id"])
+        opened = []
+        read = archive._read
+        monkeypatch.setattr(archive, "_read", lambda user_id, key: opened.append(key) or read(user_id, key))
+        assert [e["text"] for e in storage.list_backlog(USER_ID, 2025)] == ["jan 5 trip"]
+        assert opened == ["2025-01"]
+
+    def test_existing_backlog_is_migrated(self, tmp_path):
+        plain = Storage(str(tmp_path / "storage.json"))
+        plain.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        plain.remove_task(USER_ID, 0)
+        storage, archive = self.make_storage(tmp_path)
+        assert "backlog" not in storage.get_user(USER_ID)
+        assert [e["text"] for e in storage.list_backlog(USER_ID, None, 2)] == ["feb 3 party"]
+        # reopening doesn't archive it twice
+        storage, archive = self.make_storage(tmp_path)
+        assert len(storage.list_backlog(USER_ID)) == 1
+
+    @pytest.mark.parametrize("compress", [True, False])
+    def test_torn_partition_is_repaired(self, tmp_path, compress):
+        storage, archive = self.make_storage(tmp_path, compress=compress)
+        for text in ("feb 3 party", "feb 4 exam", "feb 5 trip"):
+            storage.add_task(USER_ID, text, datetime(2026, 2, int(text[4])))
+        storage.remove_task(USER_ID, 0)
+        storage.remove_task(USER_ID, 0)
+        path = archive._path(USER_ID, "2026-02")
+        # a crash part way through the second append; a gzip member ends in an 8-byte trailer
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - (16 if compress else 5))
+        storage, archive = self.make_storage(tmp_path, compress=compress)
+        assert [e["text"] for e in storage.list_backlog(USER_ID, 2026, 2)] == ["feb 3 party"]
+        assert os.path.exists(path + ".corrupt")
+        storage.remove_task(USER_ID, 0)
+        storage.add_task("456", "mar 1 other", datetime(2026, 3, 1))
+        reopened, _ = self.make_storage(tmp_path, compress=compress)
+        assert [e["text"] for e in reopened.list_backlog(USER_ID)] == ["feb 3 party", "feb 5 trip"]
+        assert reopened.list_tasks("456")[0]["text"] == "mar 1 other"
+
+    def test_failing_archive_does_not_block_writes(self, tmp_path, monkeypatch):
+        storage, archive = self.make_storage(tmp_path)
+        storage.add_task(USER_ID, "feb 3 party", datetime(2026, 2, 3))
+        append = archive.append
+
+        def broken(user_id, events):
+            raise OSError("disk full")
+        monkeypatch.setattr(archive, "append", broken)
+        storage.remove_task(USER_ID, 0)
+        storage.add_task("456", "mar 1 other", datetime(2026, 3, 1))
+        # kept in storage.json until the archive takes it
+        on_disk = Storage(str(tmp_path / "storage.json"))
+        assert on_disk.list_tasks("456") and [e["text"] for e in on_disk.list_backlog(USER_ID)] == ["feb 3 party"]
+        assert [e["text"] for e in storage.list_backlog(USER_ID)] == ["feb 3 party"]
+        monkeypatch.setattr(archive, "append", append)
+        storage.set_timezone("456", 1)
+        assert archive.partitions(USER_ID) == {"2026-02"}
+        assert "backlog" not in storage.get_user(USER_ID)
+        assert [e["text"] for e in storage.list_backlog(USER_ID)] == ["feb 3 party"]
+
+    def test_pending_archive_dropped_on_rollback(self, tmp_path):
+        storage, archive = self.make_storage(tmp_path)
+        storage.flush_interval = 60
+        storage.add_task(USER_ID, "a", datetime.max)
+        storage.add_task(USER_ID, "b", datetime.max)
+        event_id, other_id = [e["id"] for e in storage.sorted_tasks(USER_ID)]
+        with pytest.raises(AttributeError):
+            with storage.batch() as batch:
+                batch.remove_event(USER_ID, event_id)
+                batch.edit_event(USER_ID, other_id, "b", None)
+        storage.close()
+        assert storage.list_backlog(USER_ID) == []
+        assert archive.partitions(USER_ID) == set()
+
+
+class TestSerializer:
+    def test_snapshot_round_trip_and_lazy_users(self, tmp_path):
+        from serializer import get_serializer, LazyUsers, read_user
+        path = str(tmp_path / "storage.json")
+        storage = Storage(path, serializer=get_serializer("snapshot"))
+        storage.add_task("1", "a", datetime.max)
+        storage.add_task("2", "b", datetime.max)
+        assert read_user(path, "2")["events"][0]["text"] == "b"
+        assert read_user(path, "3") is None
+
+        reopened = Storage(path, serializer=get_serializer("snapshot"))
+        assert isinstance(reopened._data, LazyUsers)
+        assert reopened.list_users() == ["1", "2"]
+        reopened.add_task("1", "c", datetime.max)
+        # user 2 was never decoded and is written back from its original bytes
+        assert "2" not in reopened._data._decoded
+        assert [e["text"] for e in read_user(path, "1")["events"]] == ["a", "c"]
+        assert read_user(path, "2")["events"][0]["text"] == "b"
+
+    def test_archive_migration_keeps_snapshot_lazy(self, tmp_path):
+        from archive import ColdArchive
+        from serializer import get_serializer
+        path = str(tmp_path / "storage.json")
+        plain = Storage(path, serializer=get_serializer("snapshot"))
+        plain.add_task("1", "a", datetime.max)
+        plain.add_task("2", "feb 3 party", datetime(2026, 2, 3))
+        plain.remove_task("2", 0)
+        archive = ColdArchive(str(tmp_path / "archive"))
+        migrated = Storage(path, serializer=get_serializer("snapshot"), archive=archive)
+        assert set(migrated._data._decoded) == {"2"}
+        assert [e["text"] for e in migrated.list_backlog("2")] == ["feb 3 party"]
+        reopened = Storage(path, serializer=get_serializer("snapshot"), archive=archive)
+        assert reopened._data._decoded == {}
+
+    def test_switching_formats_reads_old_file(self, tmp_path):
+        from serializer import get_serializer
+        path = str(tmp_path / "storage.json")
+        Storage(path).add_task(USER_ID, "a", datetime.max)
+        compact = Storage(path, serializer=get_serializer("snapshot"))
+        compact.add_task(USER_ID, "b", datetime.max)
+        back = Storage(path, serializer=get_serializer("json"))
+        back.add_task(USER_ID, "c", datetime.max)
+        with open(path) as f:
+            assert "\n" not in f.read()
+        assert [e["text"] for e in Storage(path).list_tasks(USER_ID)] == ["a", "b", "c"]
+
+
+class TestSchedulerPool:
+    # events long past, so their archive reminder is due as soon as a worker builds
+    USERS = {
+        "1": {"events": [{"text": "jan 1 9:00 a", "date": "2020-01-01", "id": 1}]},
+        "2": {"events": [{"text": "jan 2 9:00 b", "date": "2020-01-02", "id": 1}]},
+    }
+
+    def test_partition_is_stable(self):
+        from scheduler_pool import partition_of
+        assert partition_of("123", 4) == partition_of(123, 4)
+        assert {partition_of(str(i), 4) for i in range(100)} == {0, 1, 2, 3}
+
+    def test_worker_reports_due_reminders(self):
+        import queue
+        import threading
+        from scheduler import ARCHIVE
+        from scheduler_pool import run_worker, BUILD, STOP
+        inbox, outbox = queue.Queue(), queue.Queue()
+        worker = threading.Thread(target=run_worker, args=(inbox, outbox, 3))
+        worker.start()
+        inbox.put((BUILD, datetime.utcnow(), {"1": self.USERS["1"]}, None))
+        partition, _, due = outbox.get(timeout=5)
+        inbox.put((STOP,))
+        worker.join(timeout=5)
+        assert partition == 3
+        assert [(r.user_id, r.kind) for r in due] == [("1", ARCHIVE)]
+
+    def test_pool_collects_from_every_worker(self, tmp_path):
+        from ledger import SentLedger
+        from scheduler import reminder_key
+        from scheduler_pool import SchedulerPool
+        ledger = SentLedger(str(tmp_path / "sent.log"))
+        pool = SchedulerPool(2, ledger=ledger)
+        pool.start()
+        try:
+            pool.build(datetime.utcnow(), self.USERS)
+            due = []
+            for _ in range(10):
+                due += pool.receive(timeout=5)
+                if pool.watermark() is not None and len(due) == 2:
+                    break
+            assert sorted(r.user_id for r in due) == ["1", "2"]
+            ledger.mark_sent(reminder_key(due[0]), due[0].due)
+            # rescheduling re-reports the reminder, but the ledger already has it
+            pool.reschedule_user(due[0].user_id, datetime.utcnow(), self.USERS[due[0].user_id])
+            assert pool.receive(timeout=5) == []
+        finally:
+            pool.close()
+            ledger.close()
+
+    def test_build_sends_a_snapshot(self):
+        import copy
+        from scheduler_pool import SchedulerPool
+        users = copy.deepcopy(self.USERS)
+        pool = SchedulerPool(1)
+        pool.start()
+        try:
+            pool.build(datetime.utcnow(), users)
+            # storage changing the dicts after build() must not change what the worker sees
+            for data in users.values():
+                data["events"].clear()
+            due = pool.receive(timeout=5)
+            assert sorted(r.user_id for r in due) == ["1", "2"]
+        finally:
+            pool.close()
+
+
+class TestEventColumns:
+    def users(self):
+        from utils import event_record
+        return {
+            "1": {"timezone": -5, "events": [event_record("feb 4 10:30 meeting", "2026-02-04"),
+                                             event_record("feb 5 rent", "2026-02-05"),
+                                             event_record("do laundry", None)]},
+            "2": {"timezone": 9, "events": [event_record("feb 5 24:00 deadline", "2026-02-05")]},
+        }
+
+    def test_dated_tomorrow(self, monkeypatch):
+        import columnar
+        users = self.users()
+        for vectorised in {columnar.np is not None, False}:
+            if not vectorised:
+                monkeypatch.setattr(columnar, "np", None)
+            columns = columnar.EventColumns(users)
+            assert len(columns) == 4
+            # at 23:00 UTC on feb 3 it is already feb 4 in UTC+9, so user 2's tomorrow is feb 5
+            assert [columns.text(i) for i in columns.dated_tomorrow(datetime(2026, 2, 3, 23, 0), untimed_only=False)] == [
+                "feb 4 10:30 meeting", "feb 5 24:00 deadline"]
+            assert [columns.row(i) for i in columns.dated_tomorrow(datetime(2026, 2, 4, 12, 0))] == [
+                ("1", {"text": "feb 5 rent", "date": "2026-02-05"})]
+
+
+class TestRenderCache:
+    def test_chunks_fit_discord_limit(self):
+        from render import chunk_lines, MAX_MESSAGE
+        lines = [f"{i}. " + "x" * 90 for i in range(100)] + ["y" * 5000]
+        chunks = chunk_lines(lines, header="Your upcoming events:")
+        assert all(len(c) <= MAX_MESSAGE and c.startswith("```") and c.endswith("```") for c in chunks)
+        assert chunks[0].startswith("```Your upcoming events:\n0. ")
+        assert "".join(c.strip("`").replace("\n", "") for c in chunks) == "Your upcoming events:" + "".join(lines)
+        assert chunk_lines([]) == []
+
+    def test_cached_until_events_change(self, tmp_path):
+        from render import RenderCache
+        storage = Storage(str(tmp_path / "storage.json"))
+        renders = RenderCache(storage)
+        assert renders.chunks(USER_ID, "list") == []
+        storage.add_task(USER_ID, "b", datetime.max)
+        storage.add_task(USER_ID, "a", datetime.max)
+        assert renders.chunks(USER_ID, "list") == ["```1. a\n2. b```"]
+        assert renders.chunks(USER_ID, "list") is renders.chunks(USER_ID, "list")
+        assert renders.chunks(USER_ID, "summary") == ["```Your upcoming events:\n1. a 🐱🌹\n2. b 🐱🌹```"]
+        storage.set_timezone(USER_ID, 3)
+        assert renders.stats()["misses"] == 3 and renders.chunks(USER_ID, "list") == ["```1. a\n2. b```"]
+        storage.remove_event(USER_ID, storage.task_at(USER_ID, 1)["id"])
+        assert renders.chunks(USER_ID, "list") == ["```1. b```"]
+        assert renders.stats()["misses"] == 4
+        view = renders.view(USER_ID, "backlog", None, None)
+        assert [e["text"] for e in view] == ["a"] and renders.view(USER_ID, "backlog", None, None) is view
+
+    def test_summary_burst_keeps_lists_cached(self, tmp_path):
+        from render import RenderCache
+        storage = Storage(str(tmp_path / "storage.json"))
+        renders = RenderCache(storage, maxsize=2)
+        storage.add_task(USER_ID, "a", datetime.max)
+        listed = renders.chunks(USER_ID, "list")
+        for user_id in range(10):
+            renders.chunks(str(user_id), "summary")
+        assert renders.chunks(USER_ID, "list") is listed
+        assert renders.stats()["cached"] == 3
+
+
+class TestCommandEngine:
+    def run(self, tmp_path, *messages, **kwargs):
+        from async_storage import AsyncStorage
+        from engine import CommandEngine
+
+        async def go():
+            storage = AsyncStorage(Storage(str(tmp_path / "storage.json"),
+                                           birthdays_filename=str(tmp_path / "birthdays.json")))
+            engine = CommandEngine(storage, stats_text=lambda: "ticks=0")
+            try:
+                return [await engine.handle(USER_ID, m, **kwargs) for m in messages]
+            finally:
+                await storage.close()
+        return asyncio.run(go())
+
+    def test_commands_return_replies_and_side_effects(self, tmp_path):
+        add, dup, listed, removed = self.run(
+            tmp_path, "type add feb 2 2026 party", "type add feb 2 2026 party", "Type list", "type remove 1")
+        assert add.replies[0].text == "```Event added (1): feb 2 party```"
+        assert len(add.replies) == 2  # welcome message for a new user
+        assert add.reschedule == [USER_ID]
+        assert dup.reschedule == [] and "already exists" in dup.replies[0].text
+        assert listed.replies[0].text == "```1. feb 2 party```"
+        assert removed.replies[0].text == "```Removed events:\n1. feb 2 party```"
+
+    def test_unknown_non_command_and_owner_only(self, tmp_path):
+        unknown, ignored, stats, bad = self.run(tmp_path, "type nope", "hello", "type stats", "type edit x")
+        assert "Unknown command" in unknown.replies[0].text
+        assert ignored is None
+        assert "Only the bot owner" in stats.replies[0].text
+        assert "Invalid arguments" in bad.replies[0].text
+        (owner_stats,) = self.run(tmp_path, "type stats", is_owner=True)
+        assert owner_stats.replies[0].text == "```ticks=0```"
+
+    def test_import_attachment_and_export_file(self, tmp_path):
+        from engine import FileAttachment
+        path = tmp_path / "events.csv"
+        path.write_text("date,text\n2026-03-01,dentist\n")
+        (imported,) = self.run(tmp_path, "type import", attachments=[FileAttachment(str(path))])
+        assert imported.replies[0].text == "```Imported 1 events.```"
+        (pasted,) = self.run(tmp_path, "type import jan 3 fine\nfeb 30 bad\njan 6 10:75 meeting")
+        assert pasted.replies[0].text == (
+            "```Imported 1 events. Skipped 2 lines with invalid dates or times (first: feb 30 bad).```")
+        (exported,) = self.run(tmp_path, "type export")
+        filename, content = exported.replies[0].file
+        assert filename == "type-bot-export.csv" and b"dentist" in content
+
+    def test_long_lists_are_paged_with_cursors(self, tmp_path):
+        from async_storage import AsyncStorage
+        from engine import CommandEngine, PAGE_SIZE, decode_cursor
+        storage = Storage(str(tmp_path / "storage.json"))
+        storage.add_tasks(USER_ID, [(f"task {i:02d} " + "x" * 100, datetime.max) for i in range(PAGE_SIZE * 2 + 5)])
+        for i in range(3):
+            storage.add_task(USER_ID, f"jan {i + 1} 2025 trip", datetime(2025, 1, i + 1))
+            storage.archive_event(USER_ID, {"text": f"jan {i + 1} 2025 trip", "date": f"2025-01-0{i + 1}"})
+
+        async def go():
+            engine = CommandEngine(AsyncStorage(storage))
+            first = await engine.handle(USER_ID, "type list")
+            last = await engine.handle(USER_ID, "type list page 9")
+            back = await engine.page(USER_ID, last.replies[0].pager[0])
+            backlog = await engine.handle(USER_ID, "type backlog 2025 page 1")
+            return first.replies, last.replies, back, backlog.replies, await engine.page(USER_ID, "junk")
+        first, last, back, backlog, junk = asyncio.run(go())
+
+        assert len(first) == 1 and first[0].pager[0] is None
+        assert decode_cursor(first[0].pager[1]) == ("list", None, None, 2)
+        lines = first[0].text.strip("`").split("\n")
+        assert len(lines) == PAGE_SIZE + 1 and lines[-1] == "page 1/3"
+        assert lines[0].startswith("1. task 00 ") and lines[0].endswith("…") and len(lines[0]) == 83
+        # past the end clamps to the last page
+        assert last[0].text.strip("`").split("\n")[-1] == "page 3/3" and last[0].pager[1] is None
+        assert back.text.startswith(f"```{PAGE_SIZE + 1}. task {PAGE_SIZE:02d}")
+        assert backlog[0].text == "```1. jan 1 2025 trip\n2. jan 2 2025 trip\n3. jan 3 2025 trip\npage 1/1```"
+        assert backlog[0].pager == (None, None)
+        assert junk is None
+
+    def test_replay_cli(self, tmp_path, capsys):
+        import engine
+        script = tmp_path / "script.txt"
+        (tmp_path / "events.txt").write_text("feb 1 2026 b\n")
+        script.write_text(f"add jan 5 2026 a\n# comment\nadd lunch @ noon\nimport @{tmp_path / 'events.txt'}\ntype list\n")
+        engine.main([str(script), "--storage", str(tmp_path / "cli.json")])
+        out = capsys.readouterr()
+        assert "1. jan 5 a\n2. feb 1 b\n3. lunch @ noon" in out.out
+        assert out.err.startswith("4 commands in")
+
+
 class TestReminderTimeCalculation:
     """Test the reminder time calculation logic used in reminder_loop"""
 
@@ -186,3 +1207,94 @@ class TestReminderTimeCalculation:
         now = datetime(2026, 2, 4, 3, 30)  # user's reminder time
         tomorrow = now.date() + timedelta(days=1)
         assert event_date.date() == tomorrow
+
+
+class TestReminderScheduler:
+    def test_summary_scheduled_at_reminder_time(self, storage):
+        from scheduler import ReminderScheduler, SUMMARY
+        storage.set_timezone(USER_ID, -5)
+        scheduler = ReminderScheduler(storage)
+        scheduler.build(datetime(2026, 2, 4, 12, 0))
+        # 03:30 in UTC-5 is 08:30 UTC, already past today
+        assert scheduler.next_due() == datetime(2026, 2, 5, 8, 30)
+        due = scheduler.pop_due(datetime(2026, 2, 5, 8, 30))
+        assert [r.kind for r in due] == [SUMMARY]
+        assert scheduler.next_due() == datetime(2026, 2, 6, 8, 30)
+
+    def test_hour_before_and_archive(self, storage):
+        from scheduler import ReminderScheduler, HOUR_BEFORE, ARCHIVE
+        storage.add_task(USER_ID, "feb 4 10:30 meeting", datetime(2026, 2, 4))
+        scheduler = ReminderScheduler(storage)
+        scheduler.build(datetime(2026, 2, 4, 4, 0))
+        assert scheduler.pop_due(datetime(2026, 2, 4, 9, 29)) == []
+        assert [r.kind for r in scheduler.pop_due(datetime(2026, 2, 4, 9, 30))] == [HOUR_BEFORE]
+        assert [r.kind for r in scheduler.pop_due(datetime(2026, 2, 4, 10, 31))] == [ARCHIVE]
+
+    def test_past_reminders_skipped_but_archived(self, storage):
+        from scheduler import ReminderScheduler, ARCHIVE
+        storage.add_task(USER_ID, "feb 4 10:30 meeting", datetime(2026, 2, 4))
+        scheduler = ReminderScheduler(storage)
+        scheduler.build(datetime(2026, 2, 4, 11, 0))
+        assert [r.kind for r in scheduler.pop_due(datetime(2026, 2, 4, 11, 0))] == [ARCHIVE]
+
+    def test_catch_up_since_last_tick(self, storage, tmp_path):
+        from scheduler import ReminderScheduler, reminder_key, SUMMARY, HOUR_BEFORE
+        from ledger import SentLedger
+        storage.add_task(USER_ID, "feb 4 9:00 meeting", datetime(2026, 2, 4))
+        ledger = SentLedger(str(tmp_path / "sent.log"), now_utc=datetime(2026, 2, 4, 3, 0))
+        scheduler = ReminderScheduler(storage, ledger=ledger)
+        # down from 03:00 to 08:45: the 03:30 summary and 08:00 reminder are caught up
+        scheduler.build(datetime(2026, 2, 4, 8, 45), since=datetime(2026, 2, 4, 3, 0))
+        due = scheduler.pop_due(datetime(2026, 2, 4, 8, 45))
+        assert [r.kind for r in due] == [SUMMARY, HOUR_BEFORE]
+        for r in due:
+            ledger.mark_sent(reminder_key(r), r.due)
+        ledger.complete_tick(datetime(2026, 2, 4, 8, 45, 30))
+        ledger.close()
+
+        # restart: the ledger stops a second delivery even though the window overlaps
+        ledger = SentLedger(str(tmp_path / "sent.log"), now_utc=datetime(2026, 2, 4, 8, 50))
+        assert ledger.last_tick == datetime(2026, 2, 4, 8, 45)
+        scheduler = ReminderScheduler(storage, ledger=ledger)
+        scheduler.build(datetime(2026, 2, 4, 8, 50), since=datetime(2026, 2, 4, 3, 0))
+        assert scheduler.pop_due(datetime(2026, 2, 4, 8, 50)) == []
+        ledger.close()
+
+    def test_ledger_drops_old_entries(self, tmp_path):
+        from ledger import SentLedger
+        path = str(tmp_path / "sent.log")
+        ledger = SentLedger(path, now_utc=datetime(2026, 2, 1))
+        ledger.mark_sent("old", datetime(2026, 2, 1))
+        ledger.mark_sent("new", datetime(2026, 2, 4))
+        ledger.close()
+        ledger = SentLedger(path, now_utc=datetime(2026, 2, 5))
+        assert not ledger.was_sent("old")
+        assert ledger.was_sent("new")
+        ledger.close()
+
+    def test_reschedule_drops_stale_entries(self, storage):
+        from scheduler import ReminderScheduler, HOUR_BEFORE
+        storage.add_task(USER_ID, "feb 4 10:30 meeting", datetime(2026, 2, 4))
+        scheduler = ReminderScheduler(storage)
+        now = datetime(2026, 2, 4, 4, 0)
+        scheduler.build(now)
+        storage.edit_task(USER_ID, 0, "feb 4 12:00 meeting", datetime(2026, 2, 4))
+        scheduler.reschedule_user(USER_ID, now)
+        assert scheduler.pop_due(datetime(2026, 2, 4, 10, 0)) == []
+        due = scheduler.pop_due(datetime(2026, 2, 4, 11, 0))
+        assert [(r.kind, r.event["text"]) for r in due] == [(HOUR_BEFORE, "feb 4 12:00 meeting")]
+
+    def test_reschedule_keeps_reminders_not_yet_popped(self, storage):
+        from scheduler import ReminderScheduler, SUMMARY, HOUR_BEFORE
+        storage.add_task(USER_ID, "feb 4 4:31 call", datetime(2026, 2, 4))
+        storage.set_timezone(USER_ID, 1)
+        scheduler = ReminderScheduler(storage)
+        scheduler.build(datetime(2026, 2, 4, 2, 29))
+        # the user runs a command while the loop is still busy with an earlier minute
+        scheduler.reschedule_user(USER_ID, datetime(2026, 2, 4, 2, 31, 5))
+        due = scheduler.pop_due(datetime(2026, 2, 4, 2, 31, 5))
+        assert [r.kind for r in due] == [SUMMARY, HOUR_BEFORE]
+        assert due[0].due == datetime(2026, 2, 4, 2, 30)
+        # once popped, rescheduling doesn't bring them back
+        scheduler.reschedule_user(USER_ID, datetime(2026, 2, 4, 2, 32))
+        assert scheduler.pop_due(datetime(2026, 2, 4, 2, 32)) == []
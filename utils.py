@@ -1,4 +1,6 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
+from functools import lru_cache
 import re
 
 
@@ -33,6 +35,11 @@ def matches_date_filter(date_str, year, month):
     return True
 
 
+def event_key(text, date_str):
+    """Identity used for duplicate checks: text with whitespace collapsed, plus the date."""
+    return (" ".join(text.split()), date_str)
+
+
 def format_tz(tz):
     """Format timezone offset for display (e.g., UTC-5, UTC5.5)"""
     tz_str = str(int(tz)) if tz == int(tz) else str(tz)
@@ -51,77 +58,116 @@ def get_reminder_time_utc(reminder_time_str, tz_offset, reference_date):
     return local_to_utc(local_dt, tz_offset)
 
 
+def next_reminder_time_utc(reminder_time_str, tz_offset, now_utc):
+    """Next UTC datetime strictly after now_utc at which the daily reminder fires"""
+    due = get_reminder_time_utc(reminder_time_str, tz_offset, now_utc.date())
+    while due > now_utc + timedelta(days=1):
+        due -= timedelta(days=1)
+    while due <= now_utc:
+        due += timedelta(days=1)
+    return due
+
+
+def derive_event_fields(text, date_str):
+    """Fields computed once per event: local datetime ('YYYY-MM-DD HH:MM', None if undated) and has_time."""
+    if not date_str:
+        return {"local": None, "has_time": False}
+    local_dt = datetime.strptime(date_str, "%Y-%m-%d")
+    parsed = parse_event_text(text)
+    if parsed.hour is not None:
+        if parsed.rollover:
+            local_dt = local_dt + timedelta(days=1)
+        local_dt = local_dt.replace(hour=0 if parsed.rollover else parsed.hour, minute=parsed.minute)
+    return {"local": local_dt.strftime("%Y-%m-%d %H:%M"), "has_time": parsed.hour is not None}
+
+
+def event_record(text, date_str):
+    """Build a stored event dict including its derived fields."""
+    record = {"text": text, "date": date_str}
+    record.update(derive_event_fields(text, date_str))
+    return record
+
+
+def ensure_event_fields(event):
+    """Backfill derived fields on events stored before they existed."""
+    if "local" not in event:
+        event.update(derive_event_fields(event["text"], event.get("date")))
+    return event
+
+
 def get_event_utc_datetime(event, tz_offset):
     """Get event's datetime in UTC. Returns None if event has no date/time."""
-    date_str = event.get("date")
-    if not date_str:
-        return None
-    event_date = datetime.strptime(date_str, "%Y-%m-%d")
-    time = extract_time(event["text"])
-    if not time:
+    ensure_event_fields(event)
+    if not event["has_time"]:
         return None
-    hour, minute = time
-    if hour >= 24:
-        event_date = event_date + timedelta(days=1)
-        hour = 0
-    local_dt = event_date.replace(hour=hour, minute=minute)
-    return local_to_utc(local_dt, tz_offset)
+    return local_to_utc(datetime.fromisoformat(event["local"]), tz_offset)
+
+MONTH_NUMBERS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+                 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+
+# month, then spaces, then day, then optional year: "oct 20" or "oct 20 2025"
+DATE_RE = re.compile(r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+([0-3]?\d)(?:\s+(\d{4}))?\b', re.I)
+YEAR_RE = re.compile(r'(\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+[0-3]?\d)\s+\d{4}', re.I)
+# 16:00, 9:20, 9:20am, 9:20 am, etc.
+TIME_RE = re.compile(r'\b(\d{1,2}):(\d{2})\s*(am|pm)?\b', re.I)
+
+# Everything parsed out of one event text. year is None when the text has
+# none (callers pick the current year); hour is 24 for "24:00", with
+# rollover set; display is the text with years stripped.
+ParsedText = namedtuple("ParsedText", ["month", "day", "year", "hour", "minute", "ampm", "rollover", "display"])
+
+
+@lru_cache(maxsize=8192)
+def parse_event_text(text):
+    """Parse date, time and display text in one go. Results are memoised, so treat them as immutable."""
+    month = day = year = hour = minute = ampm = None
+    m = DATE_RE.search(text)
+    if m:
+        month, day = MONTH_NUMBERS[m.group(1).lower()], int(m.group(2))
+        year = int(m.group(3)) if m.group(3) else None
+    m = TIME_RE.search(text)
+    if m:
+        hour, minute = int(m.group(1)), int(m.group(2))
+        ampm = m.group(3).lower() if m.group(3) else None
+        if ampm == 'pm' and hour != 12:
+            hour += 12
+        elif ampm == 'am' and hour == 12:
+            hour = 0
+    # YEAR_RE can only match where DATE_RE did
+    display = YEAR_RE.sub(r'\1', text) if month is not None else text
+    return ParsedText(month, day, year, hour, minute, ampm, hour is not None and hour >= 24, display)
+
+
+def parse_many(texts):
+    """parse_event_text for a batch of texts, parsing each distinct text once."""
+    return [parse_event_text(text) for text in texts]
+
 
 # remove year from event text if present
 def strip_year(text: str) -> str:
-    text = re.sub(r'(\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+[0-3]?\d)\s+\d{4}', r'\1', text, flags=re.I)
-    return text
+    return parse_event_text(text).display
 
 # returns date found in string, defaults to current year
 # only supports formats like oct 20 or oct 20 2025
 def get_date(event: str):
-    # consumes month, then spaces, then day, then optional year
-    DATE_RE = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+[0-3]?\d(?:\s+\d{4})?\b', re.I)
-    m = DATE_RE.search(event)
-    if not m:
+    parsed = parse_event_text(event)
+    if parsed.month is None:
         return datetime.max
-    s = m.group(0)
-    try:
-        return datetime.strptime(s, "%b %d %Y")
-    except ValueError:
-        return datetime.strptime(s, "%b %d").replace(year=datetime.now().year)
+    return datetime(parsed.year or datetime.now().year, parsed.month, parsed.day)
 
+@lru_cache(maxsize=4096)
 def natural_sort(text):
     def convert(text):
         return int(text) if text.isdigit() else text.lower()
-    return [convert(c) for c in re.split('([0-9]+)', text)]
+    return tuple(convert(c) for c in re.split('([0-9]+)', text))
 
 def extract_time(text):
     """Extract time from text like 'jan 7 16:00 event' or 'jan 7 9:20am event'"""
-    # Match time patterns: 16:00, 9:20, 9:20am, 9:20 am, etc.
-    time_re = re.compile(r'\b(\d{1,2}):(\d{2})\s*(am|pm)?\b', re.I)
-    m = time_re.search(text)
-    if not m:
-        return None
-    hour = int(m.group(1))
-    minute = int(m.group(2))
-    ampm = m.group(3)
-    if ampm:
-        ampm = ampm.lower()
-        if ampm == 'pm' and hour != 12:
-            hour += 12
-        elif ampm == 'am' and hour == 12:
-            hour = 0
-    return (hour, minute)
+    parsed = parse_event_text(text)
+    return None if parsed.hour is None else (parsed.hour, parsed.minute)
 
 def sort_key(event):
-    text = event["text"]
-    date_str = event.get("date")
-    if date_str:
-        date = datetime.strptime(date_str, "%Y-%m-%d")
-        time = extract_time(text)
-        if time:
-            hour, minute = time
-            if hour >= 24:
-                date = date + timedelta(days=1)
-                hour = 0
-            date = date.replace(hour=hour, minute=minute)
-    else:
-        date = datetime.max
-    return (0, date) if date != datetime.max else (1, natural_sort(text))
+    # "YYYY-MM-DD HH:MM" strings sort chronologically
+    ensure_event_fields(event)
+    return (0, event["local"]) if event["local"] else (1, natural_sort(event["text"]))
 